@@ -46,6 +46,10 @@ WRITE_BETYDB_CSV = True
 # Set to False to suppress the creation of a compatible file
 WRITE_GEOSTREAMS_CSV = True
 
+# Optional layout of the pixel array passed to calculate(): 'HWC' for (rows, columns, bands), 'CHW' for
+# (bands, rows, columns), or 'ANY' if either layout can be handled. 'HWC' is used if not defined
+PIXEL_LAYOUT = 'HWC'
+
 
 # Entry point for plot-level RBG algorithm
 def calculate(pxarray: np.ndarray):
@@ -0,0 +1,257 @@
+"""Definitions and optional functions of the algorithm, loaded once
+"""
+import logging
+from typing import NamedTuple
+
+import algorithm_rgb
+
+# Pixel array layouts an algorithm can declare with PIXEL_LAYOUT: (rows, columns, bands), (bands, rows, columns), or either
+PIXEL_LAYOUT_HWC = 'HWC'
+PIXEL_LAYOUT_CHW = 'CHW'
+PIXEL_LAYOUT_ANY = 'ANY'
+
+# The definitions of the algorithm, loaded the first time they're used
+ALGORITHM_DESCRIPTOR = None
+
+
+def get_algorithm_definition_bool(variable_name: str, default_value: bool = False) -> bool:
+    """Returns the value of the algorithm definition as a boolean value
+    Arguments:
+        variable_name: the name of the variable to look up
+        default_value: the default value to return if the variable is not defined or is None
+    """
+    value = False
+    if hasattr(algorithm_rgb, variable_name):
+        temp_name = getattr(algorithm_rgb, variable_name)
+        if temp_name:
+            value = True
+        elif temp_name is not None:
+            value = False
+
+    return value if value else default_value
+
+
+def get_algorithm_definition_str(variable_name: str, default_value: str = '') -> str:
+    """Returns the value of the string variable found in algorithm_rgb
+    Arguments:
+        variable_name: the name of the definition to find
+        default_value: the default value to return if the variable isn't defined, is not a string, or has an empty value
+    Notes:
+        If the variable can't be determined, the default value is returned
+    """
+    value = None
+    if hasattr(algorithm_rgb, variable_name):
+        temp_name = getattr(algorithm_rgb, variable_name)
+        if isinstance(temp_name, str):
+            value = temp_name.strip()
+
+    return value if value else default_value
+
+
+def get_algorithm_name() -> str:
+    """Convenience function for returning the name of the algorithm
+    """
+    return get_algorithm_descriptor().name
+
+
+def get_algorithm_variable_list(definition_name: str) -> list:
+    """Returns a list containing the variable information defined by the algorithm
+    Arguments:
+        definition_name: name of the variable definition to look up
+    Return:
+        A list of variable strings
+    Note:
+        Assumes that multiple variable-related strings are comma separated
+    """
+    if not hasattr(algorithm_rgb, definition_name):
+        raise RuntimeError("Unable to find %s defined in algorithm_rgb code" % definition_name)
+
+    names = getattr(algorithm_rgb, definition_name).strip()
+    if not names:
+        raise RuntimeError("Empty %s definition specified in algorithm_rgb code" % definition_name)
+
+    return names.split(',')
+
+
+def get_algorithm_variable_labels() -> list:
+    """Returns a list containing all the variable names defined by the algorithm
+    Return:
+        A list of variable names
+    """
+    return_labels = []
+    if hasattr(algorithm_rgb, 'VARIABLE_LABELS'):
+        labels = getattr(algorithm_rgb, 'VARIABLE_LABELS').strip()
+        if labels:
+            return_labels = labels.split(',')
+
+    return return_labels
+
+
+def load_algorithm_descriptor() -> 'AlgorithmDescriptor':
+    """Loads and checks the definitions of the algorithm
+    Return:
+        Returns the descriptor of the algorithm
+    Exceptions:
+        RuntimeError is raised if the variable names or units aren't defined, or if a variable, citation, or
+        method definition isn't a string
+    """
+    for definition_name in ['VARIABLE_NAMES', 'VARIABLE_UNITS', 'VARIABLE_LABELS', 'CITATION_AUTHOR', 'CITATION_TITLE',
+                            'CITATION_YEAR', 'ALGORITHM_METHOD']:
+        definition = getattr(algorithm_rgb, definition_name, None)
+        if definition and not isinstance(definition, str):
+            raise RuntimeError("The %s definition in algorithm_rgb code must be a string" % definition_name)
+
+    variable_names = tuple(get_algorithm_variable_list('VARIABLE_NAMES'))
+    variable_units = tuple(get_algorithm_variable_list('VARIABLE_UNITS'))
+    variable_labels = tuple(get_algorithm_variable_labels())
+
+    return AlgorithmDescriptor(
+        name=get_algorithm_definition_str('ALGORITHM_NAME', 'unknown algorithm'),
+        metadata_name=get_algorithm_definition_str('ALGORITHM_NAME', 'unknown'),
+        version=get_algorithm_definition_str('VERSION', 'x.y'),
+        author=get_algorithm_definition_str('ALGORITHM_AUTHOR', 'mystery author'),
+        author_email=get_algorithm_definition_str('ALGORITHM_AUTHOR_EMAIL', '(no email)'),
+        variable_names=variable_names,
+        variable_units=variable_units,
+        variable_labels=variable_labels,
+        citation_author=getattr(algorithm_rgb, 'CITATION_AUTHOR', None) or '',
+        citation_title=getattr(algorithm_rgb, 'CITATION_TITLE', None) or '',
+        citation_year=getattr(algorithm_rgb, 'CITATION_YEAR', None) or '',
+        method=getattr(algorithm_rgb, 'ALGORITHM_METHOD', None) or '',
+        write_geostreams_csv=get_algorithm_definition_bool('WRITE_GEOSTREAMS_CSV', False),
+        write_betydb_csv=get_algorithm_definition_bool('WRITE_BETYDB_CSV', False),
+        pixel_layout=load_algorithm_pixel_layout(),
+        supports_chunks=callable(getattr(algorithm_rgb, 'calculate_map', None)) and
+        callable(getattr(algorithm_rgb, 'calculate_combine', None)),
+        supports_batches=callable(getattr(algorithm_rgb, 'calculate_batch', None)),
+        variable_header_fields=tuple(get_variable_header_fields(variable_names, variable_units,
+                                                                variable_labels))
+    )
+
+
+def get_algorithm_descriptor() -> 'AlgorithmDescriptor':
+    """Returns the descriptor of the algorithm used in this process
+    Return:
+        Returns the descriptor, loading it if needed
+    Exceptions:
+        RuntimeError is raised if the algorithm's definitions are not valid
+    """
+    # pylint: disable=global-statement
+    global ALGORITHM_DESCRIPTOR
+
+    if ALGORITHM_DESCRIPTOR is None:
+        ALGORITHM_DESCRIPTOR = load_algorithm_descriptor()
+
+    return ALGORITHM_DESCRIPTOR
+
+
+def get_variable_header_fields(variable_names: tuple, variable_units: tuple, variable_labels: tuple) -> list:
+    """Returns the list of the variables' header fields incorporating their names, units, and labels
+    Arguments:
+        variable_names: the names of the variables
+        variable_units: the units of the variables
+        variable_labels: the labels of the variables
+    Return:
+         A list of strings that can be used as the header fields of the variables in a CSV file
+    """
+    header_fields = []
+    variable_units_len = len(variable_units)
+    variable_labels_len = len(variable_labels)
+
+    if variable_units_len != len(variable_names):
+        logging.warning("The number of variable units doesn't match the number of variable names")
+        logging.warning("Continuing with defined variable units")
+    if variable_labels_len and variable_labels_len != len(variable_names):
+        logging.warning("The number of variable labels doesn't match the number of variable names")
+        logging.warning("Continuing with defined variable labels")
+
+    logging.debug("Variable names: %s", str(variable_names))
+    logging.debug("Variable labels: %s", str(variable_labels))
+    logging.debug("Variable units: %s", str(variable_units))
+
+    for idx, field_name in enumerate(variable_names):
+        field_header = field_name
+        if idx < variable_labels_len:
+            field_header += ' %s' % variable_labels[idx]
+        if idx < variable_units_len:
+            field_header += ' (%s)' % variable_units[idx]
+        header_fields.append(field_header)
+
+    logging.debug("Variable header fields: %s", str(header_fields))
+    return header_fields
+
+
+def get_algorithm_pixel_layout() -> str:
+    """Returns the layout of the pixel array the algorithm wants to receive
+    Return:
+        Returns PIXEL_LAYOUT_HWC or PIXEL_LAYOUT_CHW
+    """
+    return get_algorithm_descriptor().pixel_layout
+
+
+def load_algorithm_pixel_layout() -> str:
+    """Loads the layout of the pixel array the algorithm wants to receive
+    Return:
+        Returns PIXEL_LAYOUT_HWC or PIXEL_LAYOUT_CHW
+    Notes:
+        Algorithms that accept any layout receive the planar layout since it's the least expensive to read.
+        If the algorithm doesn't declare a layout, or declares an unknown layout, PIXEL_LAYOUT_HWC is returned
+    """
+    layout = get_algorithm_definition_str('PIXEL_LAYOUT', PIXEL_LAYOUT_HWC).upper()
+    if layout == PIXEL_LAYOUT_ANY:
+        return PIXEL_LAYOUT_CHW
+    if layout not in (PIXEL_LAYOUT_HWC, PIXEL_LAYOUT_CHW):
+        logging.warning("Unknown PIXEL_LAYOUT '%s' defined in algorithm_rgb code, using '%s'", layout, PIXEL_LAYOUT_HWC)
+        return PIXEL_LAYOUT_HWC
+    return layout
+
+
+def algorithm_supports_chunks() -> bool:
+    """Returns whether the algorithm can calculate its values from chunks of an image
+    Return:
+        Returns True if the algorithm defines the calculate_map() and calculate_combine() functions
+    """
+    return get_algorithm_descriptor().supports_chunks
+
+
+def get_chunk_functions() -> tuple:
+    """Returns the algorithm's functions for calculating values from chunks of an image
+    Return:
+        Returns a tuple of the calculate_map(), calculate_combine(), and calculate_finalize() functions; the
+        calculate_finalize() function is None if the algorithm doesn't define it
+    Notes:
+        The functions are optional in the algorithm so they're looked up by name
+    """
+    finalize = getattr(algorithm_rgb, 'calculate_finalize', None)
+    return (getattr(algorithm_rgb, 'calculate_map'), getattr(algorithm_rgb, 'calculate_combine'),
+            finalize if callable(finalize) else None)
+
+
+def algorithm_supports_batches() -> bool:
+    """Returns whether the algorithm can calculate the values of many images in one call
+    Return:
+        Returns True if the algorithm defines the calculate_batch() function
+    """
+    return get_algorithm_descriptor().supports_batches
+
+
+class AlgorithmDescriptor(NamedTuple):
+    """The checked definitions of the algorithm, loaded once so they're not looked up each time they're used"""
+    name: str
+    metadata_name: str
+    version: str
+    author: str
+    author_email: str
+    variable_names: tuple
+    variable_units: tuple
+    variable_labels: tuple
+    citation_author: str
+    citation_title: str
+    citation_year: str
+    method: str
+    write_geostreams_csv: bool
+    write_betydb_csv: bool
+    pixel_layout: str
+    supports_chunks: bool
+    supports_batches: bool
+    variable_header_fields: tuple
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""Benchmarks the startup time of the plot-level RGB transformer and checks it against a budget
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import benchmark_transformer
+
+# Default maximum number of seconds from starting Python to having the command line parameters defined
+DEFAULT_MAX_ARGPARSE_SECONDS = 0.5
+
+# Default maximum number of seconds from starting Python to having the results of the first image written
+DEFAULT_MAX_FIRST_IMAGE_SECONDS = 2.0
+
+# Modules that are expected to be loaded only when an image is processed
+DEFERRED_MODULES = ['osgeo']
+
+# The script run in a new Python process to measure the startup times; the processing is the same as the
+# transformer benchmark, with the image file, CSV folder, and deferred modules passed as arguments
+STARTUP_SCRIPT = '''
+import argparse
+import json
+import sys
+import time
+import types
+import transformer
+
+transformer.RgbPlotBase().add_parameters(argparse.ArgumentParser())
+argparse_time = time.time()
+loaded_modules = [name for name in json.loads(sys.argv[3]) if name in sys.modules]
+
+environment = types.SimpleNamespace(args=argparse.Namespace(csv_path=sys.argv[2], timestamp='%s',
+                                                            geostreams_csv=True, betydb_csv=True))
+check_md = types.SimpleNamespace(timestamp='%s', working_folder=sys.argv[2], get_list_files=lambda: [sys.argv[1]])
+result = transformer.RgbPlotBase().perform_process(environment, check_md, {}, [])
+first_image_time = time.time()
+
+print(json.dumps({'argparse_time': argparse_time, 'first_image_time': first_image_time, 'code': result.get('code'),
+                  'loaded_modules': loaded_modules}))
+''' % (benchmark_transformer.BENCHMARK_TIMESTAMP, benchmark_transformer.BENCHMARK_TIMESTAMP)
+
+
+def get_arguments() -> argparse.Namespace:
+    """Returns the command line arguments
+    """
+    parser = argparse.ArgumentParser(description='Benchmarks the startup time of the plot-level RGB transformer')
+    parser.add_argument('--runs', type=int, default=5, help='the number of times to start the transformer (default: %(default)s)')
+    parser.add_argument('--width', type=int, default=512, help='the width of the image in pixels (default: %(default)s)')
+    parser.add_argument('--height', type=int, default=512, help='the height of the image in pixels (default: %(default)s)')
+    parser.add_argument('--max_argparse_seconds', type=float, default=DEFAULT_MAX_ARGPARSE_SECONDS,
+                        help='the maximum median number of seconds to define the command line parameters (default: %(default)s)')
+    parser.add_argument('--max_first_image_seconds', type=float, default=DEFAULT_MAX_FIRST_IMAGE_SECONDS,
+                        help='the maximum median number of seconds to process the first image (default: %(default)s)')
+    parser.add_argument('--algorithm_path', default=benchmark_transformer.DEFAULT_ALGORITHM_FOLDER,
+                        help='the folder containing the algorithm_rgb.py to benchmark (default: the template algorithm)')
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    return parser.parse_args()
+
+
+def run_startup(args: argparse.Namespace, image_file: str, csv_folder: str) -> dict:
+    """Starts a new Python process that loads the transformer and processes the image
+    Arguments:
+        args: the command line arguments
+        image_file: the image to process
+        csv_folder: the folder to write the CSV files to
+    Return:
+        Returns the dictionary of the number of seconds to define the parameters and to process the image, along with the
+        deferred modules that were loaded before the parameters were defined
+    """
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([args.algorithm_path, benchmark_transformer.TRANSFORMER_FOLDER] +
+                                        ([env['PYTHONPATH']] if env.get('PYTHONPATH') else []))
+
+    start_time = time.time()
+    completed = subprocess.run([sys.executable, '-c', STARTUP_SCRIPT, image_file, csv_folder, json.dumps(DEFERRED_MODULES)],
+                               env=env, cwd=csv_folder, stdout=subprocess.PIPE, check=True)
+    times = json.loads(completed.stdout.decode('utf-8').strip().splitlines()[-1])
+
+    return {
+        'argparse_seconds': times['argparse_time'] - start_time,
+        'first_image_seconds': times['first_image_time'] - start_time,
+        'code': times['code'],
+        'loaded_modules': times['loaded_modules'],
+    }
+
+
+def run_benchmark(args: argparse.Namespace, work_dir: str) -> dict:
+    """Generates the image and starts the transformer the requested number of times
+    Arguments:
+        args: the command line arguments
+        work_dir: the folder to work in
+    Return:
+        Returns the dictionary of results
+    """
+    image_args = argparse.Namespace(count=1, width=args.width, height=args.height, bands=3, dtype='uint8', format='tif',
+                                    compression='NONE', epsg=32612, no_georef=False)
+    image_folder = os.path.join(work_dir, 'images')
+    os.makedirs(image_folder, exist_ok=True)
+    image_file = benchmark_transformer.generate_images(image_args, image_folder)[0]
+
+    runs = []
+    for run_idx in range(0, args.runs):
+        csv_folder = os.path.join(work_dir, 'csv_%d' % run_idx)
+        os.makedirs(csv_folder)
+        runs.append(run_startup(args, image_file, csv_folder))
+
+    argparse_seconds = statistics.median([one_run['argparse_seconds'] for one_run in runs])
+    first_image_seconds = statistics.median([one_run['first_image_seconds'] for one_run in runs])
+    return {
+        'runs': args.runs,
+        'argparse_seconds': argparse_seconds,
+        'max_argparse_seconds': args.max_argparse_seconds,
+        'first_image_seconds': first_image_seconds,
+        'max_first_image_seconds': args.max_first_image_seconds,
+        'codes': sorted(set(one_run['code'] for one_run in runs)),
+        'modules_loaded_at_argparse': sorted(set(name for one_run in runs for name in one_run['loaded_modules'])),
+        'within_budget': argparse_seconds <= args.max_argparse_seconds and first_image_seconds <= args.max_first_image_seconds,
+    }
+
+
+def main() -> None:
+    """Runs the benchmark and exits with an error if the startup time is over budget
+    """
+    args = get_arguments()
+
+    work_dir = tempfile.mkdtemp(prefix='plot_rgb_startup_')
+    try:
+        results = run_benchmark(args, work_dir)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for key, value in results.items():
+            if isinstance(value, float):
+                value = '%.3f' % value
+            print('%-28s %s' % (key, str(value)))
+
+    if not results['within_budget']:
+        print('Startup time is over budget', file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
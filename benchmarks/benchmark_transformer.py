@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""Benchmarks the plot-level RGB transformer using generated plot images
+"""
+import argparse
+import json
+import logging
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import types
+
+import numpy as np
+from osgeo import gdal, osr
+
+# The folder containing the transformer
+TRANSFORMER_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The default folder containing the algorithm to benchmark
+DEFAULT_ALGORITHM_FOLDER = os.path.join(TRANSFORMER_FOLDER, '.github', 'workflows')
+
+# The supported image formats and their file extensions
+IMAGE_FORMATS = {'tif': ('GTiff', '.tif'), 'jpg': ('JPEG', '.jpg')}
+
+# The timestamp used when processing the images
+BENCHMARK_TIMESTAMP = '2020-06-01T12:00:00'
+
+
+def get_arguments() -> argparse.Namespace:
+    """Returns the command line arguments
+    """
+    parser = argparse.ArgumentParser(description='Benchmarks the plot-level RGB transformer with generated images')
+    parser.add_argument('--count', type=int, default=100, help='the number of plot images to generate (default: %(default)s)')
+    parser.add_argument('--width', type=int, default=512, help='the width of the images in pixels (default: %(default)s)')
+    parser.add_argument('--height', type=int, default=512, help='the height of the images in pixels (default: %(default)s)')
+    parser.add_argument('--bands', type=int, default=3, help='the number of bands in the images (default: %(default)s)')
+    parser.add_argument('--dtype', default='uint8', choices=['uint8', 'uint16', 'float32'],
+                        help='the data type of the pixels (default: %(default)s)')
+    parser.add_argument('--format', default='tif', choices=list(IMAGE_FORMATS.keys()),
+                        help='the image file format (default: %(default)s)')
+    parser.add_argument('--compression', default='NONE',
+                        help='the GeoTIFF compression to use, such as NONE, LZW, DEFLATE, or JPEG (default: %(default)s)')
+    parser.add_argument('--epsg', type=int, default=32612, help='the EPSG code of the images (default: %(default)s)')
+    parser.add_argument('--no_georef', action='store_true', help='generate images without geo-referencing')
+    parser.add_argument('--workers', type=int, default=1, help='the number of transformer workers (default: %(default)s)')
+    parser.add_argument('--algorithm_path', default=DEFAULT_ALGORITHM_FOLDER,
+                        help='the folder containing the algorithm_rgb.py to benchmark (default: the template algorithm)')
+    parser.add_argument('--work_dir', help='the folder to generate the images and CSV files in (default: a temporary folder)')
+    parser.add_argument('--keep', action='store_true', help='keep the generated files')
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    return parser.parse_args()
+
+
+def generate_images(args: argparse.Namespace, image_folder: str) -> list:
+    """Generates the plot images, one for each plot folder
+    Arguments:
+        args: the command line arguments
+        image_folder: the folder to create the plot folders in
+    Return:
+        Returns the list of generated image files
+    """
+    # pylint: disable=too-many-locals
+    driver_name, ext = IMAGE_FORMATS[args.format]
+    gdal_type = {'uint8': gdal.GDT_Byte, 'uint16': gdal.GDT_UInt16, 'float32': gdal.GDT_Float32}[args.dtype]
+    create_options = ['COMPRESS=' + args.compression] if args.format == 'tif' else []
+
+    spatial_ref = osr.SpatialReference()
+    spatial_ref.ImportFromEPSG(args.epsg)
+    projection = spatial_ref.ExportToWkt()
+
+    random_generator = np.random.default_rng(0)
+    pixels = random_generator.integers(0, 255, (args.bands, args.height, args.width)).astype(args.dtype)
+
+    mem_driver = gdal.GetDriverByName('MEM')
+    file_driver = gdal.GetDriverByName(driver_name)
+    image_files = []
+    for idx in range(0, args.count):
+        plot_folder = os.path.join(image_folder, 'plot_%06d' % idx)
+        os.makedirs(plot_folder)
+        filename = os.path.join(plot_folder, 'plot_%06d%s' % (idx, ext))
+
+        mem_ds = mem_driver.Create('', args.width, args.height, args.bands, gdal_type)
+        if not args.no_georef:
+            # Lay out the plots in a row, each one 2 meters wide with 1 centimeter pixels
+            mem_ds.SetGeoTransform((409000.0 + idx * 2.0, 0.01, 0.0, 3660000.0, 0.0, -0.01))
+            mem_ds.SetProjection(projection)
+        for band_idx in range(0, args.bands):
+            mem_ds.GetRasterBand(band_idx + 1).WriteArray(pixels[band_idx])
+        file_driver.CreateCopy(filename, mem_ds, options=create_options)
+        mem_ds = None
+
+        image_files.append(filename)
+
+    return image_files
+
+
+def run_benchmark(args: argparse.Namespace, work_dir: str) -> dict:
+    """Generates the images and runs the transformer over them
+    Arguments:
+        args: the command line arguments
+        work_dir: the folder to work in
+    Return:
+        Returns the dictionary of results
+    """
+    # pylint: disable=too-many-locals
+    sys.path.insert(0, args.algorithm_path)
+    sys.path.insert(1, TRANSFORMER_FOLDER)
+    # pylint: disable=import-outside-toplevel
+    import algorithm_rgb
+    import stage_timing
+    import transformer
+
+    image_folder = os.path.join(work_dir, 'images')
+    csv_folder = os.path.join(work_dir, 'csv')
+    os.makedirs(image_folder, exist_ok=True)
+    os.makedirs(csv_folder, exist_ok=True)
+
+    start = time.perf_counter()
+    image_files = generate_images(args, image_folder)
+    generate_seconds = time.perf_counter() - start
+
+    environment = types.SimpleNamespace(args=argparse.Namespace(csv_path=csv_folder, timestamp=BENCHMARK_TIMESTAMP,
+                                                                geostreams_csv=True, betydb_csv=True, workers=args.workers,
+                                                                timing=True))
+    check_md = types.SimpleNamespace(timestamp=BENCHMARK_TIMESTAMP, working_folder=csv_folder,
+                                     get_list_files=lambda: image_files)
+
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+    result = transformer.RgbPlotBase().perform_process(environment, check_md, {}, [])
+    process_seconds = time.perf_counter() - start
+    cpu_seconds = time.process_time() - cpu_start
+
+    pixel_bytes = args.count * args.width * args.height * args.bands * np.dtype(args.dtype).itemsize
+    file_bytes = sum(os.path.getsize(one_file) for one_file in image_files)
+    # Linux reports the maximum resident set size in kilobytes
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+    peak_children_rss_mb = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024.0
+
+    algorithm_md = result.get(algorithm_rgb.ALGORITHM_NAME, {})
+    timing = algorithm_md.get('timing', {})
+    stage_seconds = {}
+    for stage_name in stage_timing.TIMING_STAGE_NAMES:
+        stage_seconds[stage_name] = timing[stage_name]['wall']['total'] if stage_name in timing else 0.0
+    if 'final_write' in timing:
+        stage_seconds['write'] += timing['final_write']['wall']
+    return {
+        'images': args.count,
+        'image_size': '%sx%sx%s %s' % (args.width, args.height, args.bands, args.dtype),
+        'format': args.format,
+        'compression': args.compression if args.format == 'tif' else 'JPEG',
+        'epsg': None if args.no_georef else args.epsg,
+        'workers': args.workers,
+        'code': result.get('code'),
+        'files_processed': algorithm_md.get('files_processed'),
+        'lines_written': algorithm_md.get('lines_written'),
+        'generate_seconds': generate_seconds,
+        'process_seconds': process_seconds,
+        'cpu_seconds': cpu_seconds,
+        'images_per_second': args.count / process_seconds if process_seconds else 0,
+        'pixel_mb_per_second': pixel_bytes / (1024.0 * 1024.0) / process_seconds if process_seconds else 0,
+        'file_mb_per_second': file_bytes / (1024.0 * 1024.0) / process_seconds if process_seconds else 0,
+        'stage_seconds': stage_seconds,
+        'peak_rss_mb': peak_rss_mb,
+        'peak_worker_rss_mb': peak_children_rss_mb if args.workers > 1 else None,
+    }
+
+
+def print_results(results: dict) -> None:
+    """Prints the benchmark results in a readable form
+    Arguments:
+        results: the results to print
+    """
+    for key, value in results.items():
+        if key == 'stage_seconds':
+            continue
+        if isinstance(value, float):
+            value = '%.3f' % value
+        print('%-22s %s' % (key, str(value)))
+
+    # With multiple workers the stage times are summed across the workers and can exceed the processing time
+    print('%-22s %10s %10s %8s' % ('stage', 'seconds', 'ms/image', 'percent'))
+    total_seconds = results['process_seconds']
+    for stage_name, seconds in results['stage_seconds'].items():
+        print('%-22s %10.3f %10.3f %7.1f%%' % (stage_name, seconds, seconds * 1000.0 / max(1, results['images']),
+                                                seconds * 100.0 / total_seconds if total_seconds else 0))
+
+
+def main() -> None:
+    """Runs the benchmark
+    """
+    args = get_arguments()
+    logging.basicConfig(level=logging.WARNING)
+
+    work_dir = args.work_dir if args.work_dir else tempfile.mkdtemp(prefix='plot_rgb_benchmark_')
+    try:
+        results = run_benchmark(args, work_dir)
+    finally:
+        if not args.keep and not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        else:
+            logging.warning("Generated files were kept in: '%s'", work_dir)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_results(results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,406 @@
+"""Collecting results and writing them to CSV files
+"""
+import fcntl
+import logging
+import math
+import numbers
+import os
+from typing import Optional, Union
+import numpy as np
+
+import stage_timing
+
+# Default maximum number of rows held in memory before they're written to a CSV file
+CSV_FLUSH_MAX_ROWS = 1000
+
+# Default maximum number of bytes held in memory before they're written to a CSV file
+CSV_FLUSH_MAX_BYTES = 1024 * 1024
+
+# Maximum number of image results that are located and written together
+RESULTS_BATCH_SIZE = 1000
+
+
+def write_csv_file(filename: str, header: str, data: str) -> bool:
+    """Attempts to write out the data to the specified file. Will write the
+       header information if it's the first call to write to the file.
+       An exclusive advisory lock is held on the file while checking for the header and writing
+       the data; if another process holds the lock, this call blocks until the lock is released.
+       Args:
+            filename: path to the file to write to
+            header: Optional CSV formatted header to write to the file; can be set to None
+            data: CSV formatted data to write to the file; multiple rows are separated by newlines
+        Return:
+            Returns True if the file was written to and False otherwise
+    """
+    if not filename or not data:
+        logging.error("Empty parameter passed to write_geo_csv")
+        return False
+
+    try:
+        # pylint: disable=consider-using-with
+        csv_file = open(filename, 'a+', encoding='utf-8')
+    except Exception as ex:
+        logging.error("Unable to open CSV file for writing: '%s'", filename)
+        logging.error("Exception: %s", str(ex))
+        return False
+
+    wrote_file = False
+    try:
+        # Wait for other writers to finish
+        fcntl.lockf(csv_file, fcntl.LOCK_EX)
+        try:
+            # Check if we need to write a header
+            if os.fstat(csv_file.fileno()).st_size <= 0 and header:
+                csv_file.write(header + "\n")
+
+            # Write out data and make sure it's in the file before releasing the lock
+            csv_file.write(data + "\n")
+            csv_file.flush()
+
+            wrote_file = True
+        finally:
+            fcntl.lockf(csv_file, fcntl.LOCK_UN)
+    except Exception as ex:
+        logging.error("Exception while writing CSV file: '%s'", filename)
+        logging.error("Exception: %s", str(ex))
+        # Re-raise the exception
+        raise ex from None
+    finally:
+        csv_file.close()
+
+    # Return whether or not we wrote to the file
+    return wrote_file
+
+
+def quote_csv_value(value: str) -> str:
+    """Quotes a value for writing to a CSV file if it contains a separator, quote, or line break
+    Arguments:
+        value: the value to quote
+    Return:
+        Returns the value, quoted if needed, with any quotes doubled
+    """
+    if any(one_char in value for one_char in ',"\r\n'):
+        return '"' + value.replace('"', '""') + '"'
+    return value
+
+
+def format_significant_values(values: np.ndarray, significant_digits: int) -> list:
+    """Formats the values of each row with the number of significant digits
+    Arguments:
+        values: the array of rows of values to format
+        significant_digits: the number of significant digits to keep
+    Return:
+        Returns a list with the list of value strings of each row
+    """
+    value_format = '.' + str(significant_digits) + 'g'
+    return [[format(one_value, value_format) for one_value in row] for row in values.tolist()]
+
+
+def get_table_csv_rows(fields: list, traits: dict, columns: dict, num_rows: int) -> list:
+    """Returns the CSV formatted rows of the columns
+    Arguments:
+        fields: the list of field names in the order they're written
+        traits: the trait values of fields that don't have a column, as returned with the traits tables
+        columns: dictionary of field names and their lists of row values, as strings
+        num_rows: the number of rows
+    Return:
+        Returns the list of CSV formatted rows
+    Notes:
+        If a field has neither a column nor a trait value, its value is empty
+    """
+    field_columns = []
+    for field_name in fields:
+        if field_name in columns:
+            field_columns.append(columns[field_name])
+        else:
+            field_columns.append([str(traits.get(field_name, ''))] * num_rows)
+
+    return [','.join(row) for row in zip(*field_columns)]
+
+
+def get_table_string_columns(results_table: 'ResultsTable', significant_digits: int) -> tuple:
+    """Returns the columns of the results table converted to strings
+    Arguments:
+        results_table: the table of results to convert
+        significant_digits: the number of significant digits to format numeric values with
+    Return:
+        Returns a tuple of the list of value strings of each row, and a dictionary of the 'site', 'species', 'source',
+        'lat', and 'lon' column names and their lists of strings
+    """
+    latitudes, longitudes = results_table.get_latlon_strings()
+    string_columns = {'lat': latitudes, 'lon': longitudes}
+    for column_name in ('site', 'species', 'source'):
+        string_columns[column_name] = results_table.get_strings(column_name)
+
+    return results_table.get_value_strings(significant_digits), string_columns
+
+
+def get_geo_table_columns(variable_names: list, value_rows: list, string_columns: dict, datestamp: str,
+                          localtime: str) -> dict:
+    """Returns the columns of the geostreams CSV file
+    Arguments:
+        variable_names: the names of the variables of each row
+        value_rows: the list of value strings of each row
+        string_columns: the string columns of the results table, as returned by get_table_string_columns()
+        datestamp: the date of the results
+        localtime: the local time of the results
+    Return:
+        Returns a dictionary of field names and their lists of row values
+    Notes:
+        Geostreams can only handle one field at a time so there's one row per field/value pair
+    """
+    num_values = len(variable_names)
+    num_rows = len(value_rows) * num_values
+    columns = {'trait': list(variable_names) * len(value_rows),
+               'dp_time': [localtime] * num_rows,
+               'value': [one_value for one_row in value_rows for one_value in one_row],
+               'timestamp': [datestamp] * num_rows
+               }
+    for column_name in ('site', 'lat', 'lon', 'source'):
+        columns[column_name] = [one_string for one_string in string_columns[column_name] for _ in range(num_values)]
+
+    return columns
+
+
+def write_table_rows(output: tuple, columns: dict, num_rows: int) -> None:
+    """Writes the rows of the columns to a CSV file
+    Arguments:
+        output: the (writer, fields, traits) of the CSV file
+        columns: dictionary of field names and their lists of row values, as strings
+        num_rows: the number of rows
+    """
+    writer, fields, traits = output
+    writer.write_rows(get_table_csv_rows(fields, traits, columns, num_rows))
+
+
+def write_results_table(results_table: 'ResultsTable', significant_digits: int, datestamp: str, localtime: str,
+                        csv_output: tuple, geo_output: Optional[tuple] = None, bety_output: Optional[tuple] = None) -> None:
+    """Writes the rows of the results table to the CSV files
+    Arguments:
+        results_table: the table of results to write
+        significant_digits: the number of significant digits to format numeric values with
+        datestamp: the date of the results
+        localtime: the local time of the results
+        csv_output: the (writer, fields, traits) of the basic CSV file
+        geo_output: the (writer, fields, traits) of the geostreams CSV file; None if the file isn't written
+        bety_output: the (writer, fields, traits) of the BETYdb CSV file; None if the file isn't written
+    Notes:
+        Each column is converted to strings once and the rows of each file are formatted together. The time spent is
+        shared equally by the rows of the table that are being timed
+    """
+    # pylint: disable=too-many-arguments
+    num_rows = results_table.num_rows
+    if num_rows <= 0:
+        return
+    table_timings = {} if results_table.has_timings() else None
+
+    with stage_timing.time_stage(table_timings, 'format'):
+        value_rows, string_columns = get_table_string_columns(results_table, significant_digits)
+
+    with stage_timing.time_stage(table_timings, 'write'):
+        columns = dict(zip(results_table.variable_names, zip(*value_rows)))
+        columns['site'] = string_columns['site']
+        columns['species'] = string_columns['species']
+
+        write_table_rows(csv_output, dict(columns, timestamp=[datestamp] * num_rows), num_rows)
+        if bety_output is not None:
+            write_table_rows(bety_output, dict(columns, local_datetime=[localtime] * num_rows), num_rows)
+        if geo_output is not None:
+            write_table_rows(geo_output, get_geo_table_columns(results_table.variable_names, value_rows, string_columns,
+                                                               datestamp, localtime),
+                             num_rows * len(results_table.variable_names))
+
+    results_table.share_timings(table_timings)
+
+
+class CsvFileWriter:
+    """Buffers rows of CSV data and writes them to the file in bulk"""
+
+    def __init__(self, filename: str, header: str, max_rows: int = CSV_FLUSH_MAX_ROWS, max_bytes: int = CSV_FLUSH_MAX_BYTES):
+        """Initializes the writer
+        Arguments:
+            filename: path to the file to write to
+            header: CSV formatted header to write if the file is empty
+            max_rows: the number of buffered rows that causes the rows to be written; zero or less to only write on flush()
+            max_bytes: the size of the buffered rows that causes the rows to be written; zero or less to only write on flush()
+        """
+        self.filename = filename
+        self.header = header
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.rows = []
+        self.num_bytes = 0
+        self.rows_written = 0
+
+    def write_rows(self, rows: list) -> None:
+        """Adds the rows of CSV data to the buffer and writes the buffered rows if a threshold is reached
+        Arguments:
+            rows: the CSV formatted rows to write
+        """
+        self.rows.extend(rows)
+        self.num_bytes += sum(len(one_row) for one_row in rows) + len(rows)
+        if (0 < self.max_rows <= len(self.rows)) or (0 < self.max_bytes <= self.num_bytes):
+            self.flush()
+
+    def flush(self) -> bool:
+        """Writes any buffered rows to the file
+        Return:
+            Returns True if there was nothing to write, or the rows were written, and False otherwise
+        Notes:
+            The buffer is cleared even when the rows couldn't be written
+        """
+        if not self.rows:
+            return True
+
+        rows = self.rows
+        self.rows = []
+        self.num_bytes = 0
+
+        if not write_csv_file(self.filename, self.header, '\n'.join(rows)):
+            logging.error("Unable to write %s rows to CSV file: '%s'", str(len(rows)), self.filename)
+            return False
+
+        self.rows_written += len(rows)
+        return True
+
+
+class ResultsTable:
+    """Columnar table of image results that are written to the CSV files together"""
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, variable_names: list, capacity: int = RESULTS_BATCH_SIZE):
+        """Initializes an empty table
+        Arguments:
+            variable_names: the names of the algorithm's variables
+            capacity: the initial number of rows to allocate; the table grows as needed
+        """
+        self.variable_names = list(variable_names)
+        self.num_rows = 0
+        self.capacity = max(1, capacity)
+        self.strings = {'site': ([], {}), 'species': ([], {}), 'source': ([], {})}
+        self.string_ids = {column_name: np.empty(self.capacity, dtype=np.int32) for column_name in self.strings}
+        self.latitudes = np.empty(self.capacity, dtype=np.float64)
+        self.longitudes = np.empty(self.capacity, dtype=np.float64)
+        self.values = np.empty((self.capacity, len(self.variable_names)), dtype=np.float64)
+        self.value_strings = {}
+        self.timings = []
+
+    def _grow(self) -> None:
+        """Doubles the number of rows the table can hold
+        """
+        self.capacity *= 2
+        for column_name, ids in self.string_ids.items():
+            self.string_ids[column_name] = np.resize(ids, self.capacity)
+        self.latitudes = np.resize(self.latitudes, self.capacity)
+        self.longitudes = np.resize(self.longitudes, self.capacity)
+        self.values = np.resize(self.values, (self.capacity, len(self.variable_names)))
+
+    def add_row(self, site: str, species: str, source: str, latitude: float, longitude: float,
+                values: Union[list, np.ndarray], timings: Optional[dict] = None) -> None:
+        """Adds the results of an image to the table
+        Arguments:
+            site: the name of the plot
+            species: the species of the plot
+            source: the path of the image file
+            latitude: the latitude of the image; numpy.nan if it's not known
+            longitude: the longitude of the image; numpy.nan if it's not known
+            values: the validated values returned by the algorithm, one for each variable
+            timings: the stage timings dictionary of the image; None if timing isn't enabled
+        Notes:
+            The site, species, and source are kept as strings. Real numbers are kept as floating point values. Other values
+            are kept as their formatted strings. Numeric arrays of values are copied into the table directly
+        """
+        # pylint: disable=too-many-arguments
+        if self.num_rows >= self.capacity:
+            self._grow()
+        row_idx = self.num_rows
+
+        for column_name, value in (('site', site), ('species', species), ('source', source)):
+            # Values from the metadata, such as the species, may not be strings
+            value = str(value)
+            names, name_ids = self.strings[column_name]
+            if value not in name_ids:
+                name_ids[value] = len(names)
+                names.append(value)
+            self.string_ids[column_name][row_idx] = name_ids[value]
+        self.latitudes[row_idx] = latitude
+        self.longitudes[row_idx] = longitude
+
+        if isinstance(values, np.ndarray) and values.dtype.kind in 'iuf':
+            self.values[row_idx] = values
+            values = ()
+        for value_idx, one_value in enumerate(values):
+            self.values[row_idx, value_idx] = np.nan
+            if isinstance(one_value, numbers.Real):
+                try:
+                    self.values[row_idx, value_idx] = float(one_value)
+                    continue
+                except (OverflowError, TypeError, ValueError):
+                    pass
+            self.value_strings[(row_idx, value_idx)] = one_value
+
+        self.timings.append(timings)
+        self.num_rows += 1
+
+    def clear(self) -> None:
+        """Removes all the rows from the table
+        """
+        self.num_rows = 0
+        self.strings = {'site': ([], {}), 'species': ([], {}), 'source': ([], {})}
+        self.value_strings = {}
+        self.timings = []
+
+    def has_timings(self) -> bool:
+        """Returns whether any of the rows are being timed
+        """
+        return any(one_timings is not None for one_timings in self.timings)
+
+    def share_timings(self, table_timings: Optional[dict]) -> None:
+        """Adds an equal share of the table's stage timings to each row's timings
+        Arguments:
+            table_timings: the stage timings of work done for the whole table; None if timing isn't enabled
+        """
+        if not table_timings or not self.num_rows:
+            return
+        for one_timings in self.timings:
+            if one_timings is None:
+                continue
+            for stage_name, (wall_seconds, cpu_seconds) in table_timings.items():
+                prev_wall, prev_cpu = one_timings.get(stage_name, (0.0, 0.0))
+                one_timings[stage_name] = (prev_wall + wall_seconds / self.num_rows, prev_cpu + cpu_seconds / self.num_rows)
+
+    def get_strings(self, column_name: str) -> list:
+        """Returns the values of a string column
+        Arguments:
+            column_name: the name of the column: 'site', 'species', or 'source'
+        Return:
+            Returns the list of the column's values, one for each row, quoted for writing to a CSV file if needed
+        """
+        # Each distinct value is only checked for quoting once
+        names = np.array([quote_csv_value(one_name) for one_name in self.strings[column_name][0]], dtype=object)
+        return names[self.string_ids[column_name][:self.num_rows]].tolist()
+
+    def get_latlon_strings(self) -> tuple:
+        """Returns the latitudes and longitudes as strings
+        Return:
+            Returns a tuple of the lists of latitude and longitude strings; unknown locations are empty strings
+        """
+        return tuple(['' if math.isnan(one_value) else str(one_value) for one_value in coordinates[:self.num_rows].tolist()]
+                     for coordinates in (self.latitudes, self.longitudes))
+
+    def get_value_strings(self, significant_digits: int) -> list:
+        """Returns the values formatted as strings
+        Arguments:
+            significant_digits: the number of significant digits to format numeric values with
+        Return:
+            Returns a list with the list of value strings of each row
+        """
+        value_rows = format_significant_values(self.values[:self.num_rows], significant_digits)
+        if self.value_strings:
+            value_format = '.' + str(significant_digits) + 'g'
+            for (row_idx, value_idx), one_value in self.value_strings.items():
+                if isinstance(one_value, numbers.Number):
+                    value_rows[row_idx][value_idx] = format(one_value, value_format)
+                else:
+                    value_rows[row_idx][value_idx] = str(one_value)
+        return value_rows
@@ -0,0 +1,433 @@
+"""Opening images and reading their pixels and geographic information
+"""
+from __future__ import annotations
+
+import collections
+import logging
+import math
+from typing import Optional, Union
+import numpy as np
+
+import algorithm_descriptor
+import stage_timing
+from lazy_modules import gdal, gdal_array, ogr, osr, osgeo
+
+# The LAT-LON EPSG code to use
+LAT_LON_EPSG_CODE = 4326
+
+# Maximum number of pixels read at one time when an algorithm processes images in chunks
+CHUNK_MAX_PIXELS = 4 * 1024 * 1024
+
+# Buffer used to read image pixels into
+PIXEL_BUFFER = None
+
+# Cache of spatial references and transformations to lat-lon, keyed by source EPSG code
+LAT_LON_TRANSFORMATIONS = {}
+
+
+def open_image_dataset(filename: str) -> gdal.Dataset:
+    """Opens the image file as a GDAL dataset
+    Arguments:
+        filename: the path of the image file to open
+    Return:
+        Returns the opened dataset. The dataset is closed when all references to it are released
+    Exceptions:
+        RuntimeError is raised if the file can't be opened
+    """
+    dataset = gdal.Open(filename)
+    if dataset is None:
+        raise RuntimeError("Unable to open image file: '%s'" % filename)
+
+    return dataset
+
+
+def get_geobounds(geo_transform: tuple, raster_x_size: int, raster_y_size: int) -> list:
+    """Calculates the rectilinear boundaries of an image from its geotransform
+
+    Args:
+        geo_transform: the geotransform of the image
+        raster_x_size: the width of the image in pixels
+        raster_y_size: the height of the image in pixels
+
+    Returns:
+        The upper-left and calculated lower-right boundaries of the image in a list.
+        The values are returned in following order: min_y, max_y, min_x, max_x
+    """
+    ulx, xres, _, uly, _, yres = geo_transform
+    lrx = ulx + (raster_x_size * xres)
+    lry = uly + (raster_y_size * yres)
+
+    min_y = min(uly, lry)
+    max_y = max(uly, lry)
+    min_x = min(ulx, lrx)
+    max_x = max(ulx, lrx)
+
+    return [min_y, max_y, min_x, max_x]
+
+
+def get_footprint_latlon(bounds: list, epsg: Union[int, str]) -> Optional[ogr.Geometry]:
+    """Returns the footprint of an image in lat-lon
+    Arguments:
+        bounds: the boundaries of the image in the order returned by dataset_get_geobounds()
+        epsg: the EPSG code of the boundaries
+    Return:
+        Returns the polygon of the footprint with its spatial reference assigned, or None if the boundaries
+        aren't known or can't be converted to lat-lon
+    """
+    if any(math.isnan(one_bound) for one_bound in bounds):
+        return None
+    min_y, max_y, min_x, max_x = bounds
+
+    ring = ogr.Geometry(ogr.wkbLinearRing)
+    for point_x, point_y in ((min_x, max_y), (max_x, max_y), (max_x, min_y), (min_x, min_y), (min_x, max_y)):
+        ring.AddPoint_2D(point_x, point_y)
+    footprint = ogr.Geometry(ogr.wkbPolygon)
+    footprint.AddGeometry(ring)
+
+    ref_sys, dest_spatial, transform = get_latlon_transformation(epsg)
+    footprint.AssignSpatialReference(ref_sys)
+    if footprint.Transform(transform) != ogr.OGRERR_NONE:
+        logging.warning("Unable to convert image footprint from EPSG %s to lat-lon", str(epsg))
+        return None
+    footprint.AssignSpatialReference(dest_spatial)
+
+    return footprint
+
+
+def dataset_is_georeferenced(dataset: gdal.Dataset) -> bool:
+    """Returns whether the opened dataset is geo-referenced
+    Arguments:
+        dataset: the opened dataset to check
+    Return:
+        Returns True if the dataset has both a projection and a geotransform
+    Notes:
+        Images without geo-referencing, such as most JPEG files, have no projection and GDAL's default geotransform;
+        checking for them up front avoids the spatial work that can't be done for these images
+    """
+    if not dataset.GetProjection():
+        return False
+    return dataset.GetGeoTransform(can_return_null=True) is not None
+
+
+def dataset_get_geobounds(dataset: gdal.Dataset, filename: str) -> list:
+    """Retrieves the rectilinear boundaries from an opened dataset
+
+    Args:
+        dataset: the opened dataset to get the boundaries from
+        filename: path of the file the dataset was opened from (used for logging)
+
+    Returns:
+        The upper-left and calculated lower-right boundaries of the image in a list upon success.
+        The values are returned in following order: min_y, max_y, min_x, max_x. A list of numpy.nan
+        is returned if the dataset isn't geo-referenced or the boundaries can't be determined
+    """
+    try:
+        if not dataset_is_georeferenced(dataset):
+            logging.debug("Image is not geo-referenced: '%s'", filename)
+            return [np.nan, np.nan, np.nan, np.nan]
+        return get_geobounds(dataset.GetGeoTransform(), dataset.RasterXSize, dataset.RasterYSize)
+    except Exception as ex:
+        logging.warning("[dataset_get_geobounds] Exception caught processing file: %s", filename)
+        logging.warning("[dataset_get_geobounds] Exception: %s", str(ex))
+
+    return [np.nan, np.nan, np.nan, np.nan]
+
+
+def dataset_get_epsg(dataset: gdal.Dataset, filename: str) -> Optional[str]:
+    """Returns the EPSG of the opened geo-referenced dataset
+    Args:
+        dataset: the opened dataset to retrieve the EPSG code from
+        filename: path of the file the dataset was opened from (used for logging)
+    Return:
+        Returns the found EPSG code, or None if it's not found or an error ocurred
+    """
+    try:
+        proj = osr.SpatialReference(wkt=dataset.GetProjection())
+
+        return proj.GetAttrValue('AUTHORITY', 1)
+    except Exception as ex:
+        logging.warning("[dataset_get_epsg] Exception caught processing file: %s", filename)
+        logging.warning("[dataset_get_epsg] Exception: %s", str(ex))
+
+    return None
+
+
+def get_latlon_transformation(epsg: Union[int, str]) -> tuple:
+    """Returns the spatial references and coordinate transformation for converting from the EPSG code to lat-lon
+    Arguments:
+        epsg: the EPSG code of the source coordinates
+    Return:
+        Returns a tuple containing the source spatial reference, the lat-lon spatial reference, and the coordinate
+        transformation between them
+    Exceptions:
+        RuntimeError is raised if either of the EPSG codes can't be imported
+    Notes:
+        The returned objects are cached and shared by all callers in this process
+    """
+    epsg = int(epsg)
+    if epsg in LAT_LON_TRANSFORMATIONS:
+        return LAT_LON_TRANSFORMATIONS[epsg]
+
+    ref_sys = osr.SpatialReference()
+    if ref_sys.ImportFromEPSG(epsg) != ogr.OGRERR_NONE:
+        msg = "Failed to import EPSG %s for conversion to lat-lon" % str(epsg)
+        logging.error(msg)
+        raise RuntimeError(msg)
+    if int(osgeo.__version__[0]) >= 3:
+        # GDAL 3 changes axis order: https://github.com/OSGeo/gdal/issues/1546
+        # pylint: disable=no-member
+        ref_sys.SetAxisMappingStrategy(osgeo.osr.OAMS_TRADITIONAL_GIS_ORDER)
+
+    dest_spatial = osr.SpatialReference()
+    if dest_spatial.ImportFromEPSG(int(LAT_LON_EPSG_CODE)) != ogr.OGRERR_NONE:
+        msg = "Failed to import EPSG %s for conversion to lat-lon" % str(LAT_LON_EPSG_CODE)
+        logging.error(msg)
+        raise RuntimeError(msg)
+    if int(osgeo.__version__[0]) >= 3:
+        # GDAL 3 changes axis order: https://github.com/OSGeo/gdal/issues/1546
+        # pylint: disable=no-member
+        dest_spatial.SetAxisMappingStrategy(osgeo.osr.OAMS_TRADITIONAL_GIS_ORDER)
+
+    LAT_LON_TRANSFORMATIONS[epsg] = (ref_sys, dest_spatial, osr.CoordinateTransformation(ref_sys, dest_spatial))
+    return LAT_LON_TRANSFORMATIONS[epsg]
+
+
+def dataset_get_geo_info(dataset: gdal.Dataset, filename: str) -> Optional[tuple]:
+    """Returns the information needed to locate the opened geo-referenced dataset
+    Arguments:
+        dataset: the opened dataset to get the information from
+        filename: path of the file the dataset was opened from (used for logging)
+    Return:
+        Returns a tuple containing the EPSG code, the geo transform, the raster X size and the raster Y size.
+        None is returned if the dataset isn't geo-referenced
+    """
+    if not dataset_is_georeferenced(dataset):
+        logging.debug("Image is not geo-referenced: '%s'", filename)
+        return None
+
+    try:
+        geo_transform = tuple(dataset.GetGeoTransform())
+    except Exception as ex:
+        logging.warning("[dataset_get_geo_info] Exception caught processing file: %s", filename)
+        logging.warning("[dataset_get_geo_info] Exception: %s", str(ex))
+        return None
+
+    epsg = dataset_get_epsg(dataset, filename)
+    if epsg is None:
+        msg = "EPSG is not found in image file: '%s'" % filename
+        logging.info(msg)
+        return None
+
+    return epsg, geo_transform, dataset.RasterXSize, dataset.RasterYSize
+
+
+def get_geo_infos_centers(geo_infos: list) -> np.ndarray:
+    """Returns the centers of geo-referenced images in their own coordinate systems
+    Arguments:
+        geo_infos: the list of image information as returned by dataset_get_geo_info(); entries can't be None
+    Return:
+        Returns a numpy array of the (X, Y) center of each image
+    Notes:
+        The center is the geo transform applied to the middle pixel location
+    """
+    geo_transforms = np.array([one_info[1] for one_info in geo_infos], dtype=np.float64)
+    half_x = np.array([one_info[2] for one_info in geo_infos], dtype=np.float64) / 2.0
+    half_y = np.array([one_info[3] for one_info in geo_infos], dtype=np.float64) / 2.0
+    return np.column_stack((geo_transforms[:, 0] + geo_transforms[:, 1] * half_x + geo_transforms[:, 2] * half_y,
+                            geo_transforms[:, 3] + geo_transforms[:, 4] * half_x + geo_transforms[:, 5] * half_y))
+
+
+def get_centroids_latlon(geo_infos: list) -> tuple:
+    """Returns the lat-lon centroids of a list of geo-referenced images
+    Arguments:
+        geo_infos: the list of image information as returned by dataset_get_geo_info(); entries can be None
+    Return:
+        Returns a tuple containing the numpy array of latitudes, the numpy array of longitudes, and a dictionary of
+        error messages keyed by the index of the entries that couldn't be converted. The latitude and longitude are
+        numpy.nan for None entries and entries in error
+    Notes:
+        The centers of the images are calculated in their own coordinate system and each group of images sharing
+        an EPSG code is converted to lat-lon in a single call
+    """
+    latitudes = np.full(len(geo_infos), np.nan)
+    longitudes = np.full(len(geo_infos), np.nan)
+    errors = {}
+
+    indexes = [idx for idx, one_info in enumerate(geo_infos) if one_info is not None]
+    if not indexes:
+        return latitudes, longitudes, errors
+    centers = get_geo_infos_centers([geo_infos[idx] for idx in indexes])
+
+    # Group the centers by their EPSG code and convert each group
+    epsg_groups = collections.defaultdict(list)
+    for center_idx, idx in enumerate(indexes):
+        epsg_groups[geo_infos[idx][0]].append(center_idx)
+
+    indexes = np.array(indexes)
+    for epsg, center_indexes in epsg_groups.items():
+        try:
+            _, _, transform = get_latlon_transformation(epsg)
+            points = np.array(transform.TransformPoints(centers[center_indexes].tolist()), dtype=np.float64)
+            longitudes[indexes[center_indexes]] = points[:, 0]
+            latitudes[indexes[center_indexes]] = points[:, 1]
+        except Exception as ex:
+            msg = "Failed to transform image centers from EPSG %s to lat-lon: %s" % (str(epsg), str(ex))
+            logging.error(msg)
+            for idx in indexes[center_indexes].tolist():
+                errors[idx] = msg
+
+    return latitudes, longitudes, errors
+
+
+def get_pixel_buffer() -> 'PixelBuffer':
+    """Returns the pixel buffer used for reading images in this process
+    Return:
+        Returns the pixel buffer instance, creating it if needed
+    """
+    # pylint: disable=global-statement
+    global PIXEL_BUFFER
+
+    if PIXEL_BUFFER is None:
+        PIXEL_BUFFER = PixelBuffer()
+
+    return PIXEL_BUFFER
+
+
+def dataset_get_pixels_shape(dataset: gdal.Dataset, layout: str = algorithm_descriptor.PIXEL_LAYOUT_HWC,
+                             window: tuple = None) -> tuple:
+    """Returns the shape and data type of the array that dataset_read_pixels() returns
+    Arguments:
+        dataset: the opened dataset
+        layout: the layout of the array: algorithm_descriptor.PIXEL_LAYOUT_HWC or algorithm_descriptor.PIXEL_LAYOUT_CHW
+        window: optional (x offset, y offset, x size, y size) of the pixels; the entire image is used by default
+    Return:
+        Returns a tuple of the array's shape and its numpy data type
+    """
+    _, _, x_size, y_size = window if window is not None else (0, 0, dataset.RasterXSize, dataset.RasterYSize)
+    if layout == algorithm_descriptor.PIXEL_LAYOUT_CHW:
+        shape = (dataset.RasterCount, y_size, x_size)
+    else:
+        shape = (y_size, x_size, dataset.RasterCount)
+    return shape, np.dtype(gdal_array.GDALTypeCodeToNumericTypeCode(dataset.GetRasterBand(1).DataType))
+
+
+def dataset_read_pixels(dataset: gdal.Dataset, pixel_buffer: 'PixelBuffer' = None,
+                        layout: str = algorithm_descriptor.PIXEL_LAYOUT_HWC, window: tuple = None,
+                        pixels: np.ndarray = None) -> np.ndarray:
+    """Reads the pixels of the opened dataset
+    Arguments:
+        dataset: the opened dataset to read
+        pixel_buffer: optional buffer to read the pixels into; a new array is allocated if not specified
+        layout: the layout of the returned array: algorithm_descriptor.PIXEL_LAYOUT_HWC or algorithm_descriptor.PIXEL_LAYOUT_CHW
+        window: optional (x offset, y offset, x size, y size) of the pixels to read; the entire image is read by default
+        pixels: optional array to read the pixels into, with the shape and data type returned by
+                dataset_get_pixels_shape(); the pixel buffer isn't used when specified
+    Return:
+        Returns a C-contiguous array of the pixels with the shape (rows, columns, bands) for
+        algorithm_descriptor.PIXEL_LAYOUT_HWC, or (bands, rows, columns) for algorithm_descriptor.PIXEL_LAYOUT_CHW
+    Notes:
+        The pixels are read directly into the returned array, one band at a time, using the data type of the first band.
+        If a pixel buffer is specified, the returned array is only valid until the buffer is used again
+    """
+    x_off, y_off, x_size, y_size = window if window is not None else (0, 0, dataset.RasterXSize, dataset.RasterYSize)
+    if pixels is None:
+        shape, dtype = dataset_get_pixels_shape(dataset, layout, window)
+        if pixel_buffer is not None:
+            pixels = pixel_buffer.get_array(shape, dtype)
+        else:
+            pixels = np.empty(shape, dtype=dtype)
+
+    for band_idx in range(0, dataset.RasterCount):
+        band_pixels = pixels[band_idx] if layout == algorithm_descriptor.PIXEL_LAYOUT_CHW else pixels[:, :, band_idx]
+        if dataset.GetRasterBand(band_idx + 1).ReadAsArray(x_off, y_off, x_size, y_size, buf_obj=band_pixels) is None:
+            raise RuntimeError("Unable to read band %s of image" % str(band_idx + 1))
+
+    return pixels
+
+
+def dataset_get_chunk_windows(dataset: gdal.Dataset, max_pixels: int = CHUNK_MAX_PIXELS, window: tuple = None) -> list:
+    """Returns the windows to read the dataset in, sized by the dataset's blocks
+    Arguments:
+        dataset: the opened dataset
+        max_pixels: the maximum number of pixels in a window; a window always contains at least one block
+        window: optional (x offset, y offset, x size, y size) area of the dataset to cover; the entire dataset by default
+    Return:
+        Returns a list of (x offset, y offset, x size, y size) windows covering the area, in row order
+    Notes:
+        Windows are made up of whole blocks, as many blocks across as possible, followed by as many rows of blocks
+        as possible, within the maximum number of pixels. Windows at the right and bottom edges are clipped
+    """
+    x_start, y_start, x_size, y_size = window if window is not None else (0, 0, dataset.RasterXSize, dataset.RasterYSize)
+    block_x, block_y = dataset.GetRasterBand(1).GetBlockSize()
+    block_x = max(1, min(block_x, x_size))
+    block_y = max(1, min(block_y, y_size))
+
+    blocks_across = max(1, min(math.ceil(x_size / block_x), max_pixels // (block_x * block_y)))
+    window_x = block_x * blocks_across
+    window_y = block_y * max(1, max_pixels // (window_x * block_y))
+
+    windows = []
+    for y_off in range(y_start, y_start + y_size, window_y):
+        for x_off in range(x_start, x_start + x_size, window_x):
+            windows.append((x_off, y_off, min(window_x, x_start + x_size - x_off), min(window_y, y_start + y_size - y_off)))
+
+    return windows
+
+
+def load_image_file(filename: str, pixel_buffer: Optional['PixelBuffer'] = None,
+                    layout: str = algorithm_descriptor.PIXEL_LAYOUT_HWC, timing: bool = False) -> tuple:
+    """Loads the geographic information and the pixels of the image file
+    Arguments:
+        filename: the path of the image file to load
+        pixel_buffer: optional buffer to read the pixels into; a new array is allocated if not specified
+        layout: the layout of the pixel array (see dataset_read_pixels())
+        timing: set to True to record the time spent in each loading stage
+    Return:
+        Returns a tuple containing the geo information as returned by dataset_get_geo_info(), the pixel array, and
+        the stage timings dictionary (None if timing isn't enabled)
+    Notes:
+        Can be called from multiple threads as long as each thread uses a different pixel buffer
+    """
+    timings = {} if timing else None
+
+    # The image is opened once and everything we need is retrieved from the one dataset
+    with stage_timing.time_stage(timings, 'open'):
+        image_ds = open_image_dataset(filename)
+    try:
+        with stage_timing.time_stage(timings, 'geo'):
+            geo_info = dataset_get_geo_info(image_ds, filename)
+        with stage_timing.time_stage(timings, 'read'):
+            image_pix = dataset_read_pixels(image_ds, pixel_buffer, layout)
+    finally:
+        # Releasing the reference closes the dataset
+        image_ds = None
+
+    return geo_info, image_pix, timings
+
+
+class PixelBuffer:
+    """Reusable memory for reading image pixels into"""
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self):
+        """Initializes the buffer
+        """
+        self.buffer = None
+
+    def get_array(self, shape: tuple, dtype) -> np.ndarray:
+        """Returns a C-contiguous array using the buffer's memory, growing the buffer if needed
+        Arguments:
+            shape: the shape of the array to return
+            dtype: the numpy data type of the array
+        Return:
+            Returns an uninitialized array with the requested shape and data type
+        Notes:
+            The returned array shares memory with arrays previously returned by this instance
+        """
+        num_bytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        if self.buffer is None or self.buffer.size < num_bytes:
+            logging.debug("Growing pixel buffer to %s bytes", str(num_bytes))
+            self.buffer = None
+            self.buffer = np.empty(num_bytes, dtype=np.uint8)
+
+        return self.buffer[:num_bytes].view(dtype).reshape(shape)
@@ -0,0 +1,625 @@
+"""Running the algorithm on image files
+"""
+from __future__ import annotations
+
+import collections
+import concurrent.futures
+import concurrent.futures.process
+import functools
+import logging
+from typing import Optional, Union
+import numpy as np
+
+import algorithm_rgb
+import algorithm_descriptor
+import csv_output
+import image_io
+import plots
+import results_cache
+import stage_timing
+from lazy_modules import gdal
+
+# Maximum number of images queued for each worker process when processing images in parallel
+MAX_PENDING_IMAGES_PER_WORKER = 4
+
+# Default number of images passed in one call when an algorithm processes images in batches
+CALCULATE_BATCH_SIZE = 32
+
+
+def validate_calc_value(calc_value, variable_names: list) -> Union[list, np.ndarray]:
+    """Returns a list of the validated value(s) as compared against type and length of variable names
+    Arguments:
+        calc_value: the calculated value(s) to validate (int, float, str, dict, list, numpy array, etc.)
+        variable_names: the list of the names of expected variables
+    Return:
+        Returns the validated values as a list, or as a one dimensional numpy array if an array was returned
+    Exceptions:
+        RuntimeError is raised if the calc_value is not a supported type or the number of values doesn't match
+        the expected number (as determined by variable_names)
+    Notes:
+        Returned arrays are copied since they may be views of the pixel buffer, which is reused
+    """
+    if isinstance(calc_value, set):
+        raise RuntimeError("A 'set' type of data was returned and isn't supported. Please use a list or a tuple instead")
+
+    # Special case handling for special return dict (values and other stuff)
+    if isinstance(calc_value, dict) and 'values' in calc_value:
+        values_result = calc_value['values']
+    else:
+        values_result = calc_value
+
+    # Arrays are checked against the variables in one step and kept as arrays
+    len_variable_names = len(variable_names)
+    if isinstance(values_result, np.ndarray):
+        if values_result.ndim == 0:
+            values_result = values_result.reshape(1)
+        if values_result.shape != (len_variable_names,):
+            raise RuntimeError("Incorrect shape of values returned. Expected " + str((len_variable_names,)) +
+                               " and received " + str(values_result.shape))
+        return values_result.copy()
+
+    # Get the values into list form
+    values = []
+    if isinstance(values_result, dict):
+        # Assume the dictionary is going to have field names with their values
+        # We check whether we have the correct number of fields later. This also
+        # filters out extra fields
+        values = []
+        for key in variable_names:
+            if key in values_result:
+                values.append(values_result[key])
+    elif not isinstance(values_result, (list, tuple)):
+        values = [values_result]
+    else:
+        values = values_result
+
+    # Sanity check our values
+    len_calc_value = len(values)
+    if not len_calc_value == len_variable_names:
+        raise RuntimeError("Incorrect number of values returned. Expected " + str(len_variable_names) +
+                           " and received " + str(len_calc_value))
+
+    return values
+
+
+def calculate_image_values(filename: str, image_pix: np.ndarray, geo_info: Optional[tuple], variable_names: list,
+                           timings: Optional[dict] = None) -> Optional[dict]:
+    """Calls the algorithm with the loaded image and validates the returned values
+    Arguments:
+        filename: the path of the image file the pixels were loaded from
+        image_pix: the pixels of the image
+        geo_info: the geo information of the image as returned by dataset_get_geo_info()
+        variable_names: the list of the names of expected variables
+        timings: the stage timings dictionary to add to; None if timing isn't enabled
+    Return:
+        Returns the same values as process_image_file()
+    """
+    # Make the call and check the results
+    with stage_timing.time_stage(timings, 'calculate'):
+        calc_value = algorithm_rgb.calculate(image_pix)
+
+    return get_image_result(filename, calc_value, geo_info, variable_names, timings)
+
+
+def get_image_result(filename: str, calc_value, geo_info: Optional[tuple], variable_names: list,
+                     timings: Optional[dict] = None) -> Optional[dict]:
+    """Validates the value returned by the algorithm and returns the image's result
+    Arguments:
+        filename: the path of the image file the value was calculated from
+        calc_value: the value returned by the algorithm
+        geo_info: the geo information of the image as returned by dataset_get_geo_info()
+        variable_names: the list of the names of expected variables
+        timings: the stage timings dictionary to add to; None if timing isn't enabled
+    Return:
+        Returns the same values as process_image_file()
+    """
+    logging.debug("Calculated value is %s for file: %s", str(calc_value), filename)
+    if calc_value is None:
+        return None
+
+    with stage_timing.time_stage(timings, 'validate'):
+        additional_files = []
+        if isinstance(calc_value, dict) and 'file' in calc_value and calc_value['file']:
+            additional_files = list(calc_value['file'])
+
+        values = validate_calc_value(calc_value, variable_names)
+    logging.debug("Verified values are %s", str(values))
+
+    return {'values': values if isinstance(values, np.ndarray) else list(values),
+            'geo': geo_info,
+            'file': additional_files,
+            'timing': timings
+            }
+
+
+def process_image_file_chunks(filename: str, variable_names: list, timing: bool = False) -> Optional[dict]:
+    """Reads the image file in chunks, calls the algorithm for each chunk and combines the chunk results,
+       and validates the returned values
+    Arguments:
+        filename: the path of the image file to process
+        variable_names: the list of the names of expected variables
+        timing: set to True to record the time spent in each processing stage
+    Return:
+        Returns the same values as process_image_file()
+    Notes:
+        The algorithm's calculate_map() function is called with the pixels of each chunk and the results are
+        combined in order, two at a time, by calling calculate_combine(). If the algorithm defines calculate_finalize(),
+        it's called with the combined result to produce the algorithm's values. All chunks are read into the same
+        buffer so the algorithm shouldn't keep references to the pixels it's passed
+    """
+    timings = {} if timing else None
+    with stage_timing.time_stage(timings, 'open'):
+        image_ds = image_io.open_image_dataset(filename)
+    try:
+        with stage_timing.time_stage(timings, 'geo'):
+            geo_info = image_io.dataset_get_geo_info(image_ds, filename)
+
+        calc_value = calculate_dataset_chunks(image_ds, image_io.dataset_get_chunk_windows(image_ds), timings)
+    finally:
+        # Releasing the reference closes the dataset
+        image_ds = None
+
+    return get_image_result(filename, calc_value, geo_info, variable_names, timings)
+
+
+def calculate_dataset_chunks(image_ds: gdal.Dataset, windows: list, timings: Optional[dict] = None):
+    """Reads the windows of the dataset one at a time and calls the algorithm's chunk functions with their pixels
+    Arguments:
+        image_ds: the opened dataset to read
+        windows: the list of (x offset, y offset, x size, y size) windows to read, as returned by
+                 dataset_get_chunk_windows()
+        timings: the stage timings dictionary to add to; None if timing isn't enabled
+    Return:
+        Returns the value produced by the algorithm for all of the windows
+    Notes:
+        The result of calculate_map() for each window is combined in order with the previous ones by calling
+        calculate_combine(). The combined result is passed to calculate_finalize() if the algorithm defines it
+    """
+    layout = algorithm_descriptor.get_algorithm_pixel_layout()
+    pixel_buffer = image_io.get_pixel_buffer()
+    calculate_map, calculate_combine, calculate_finalize = algorithm_descriptor.get_chunk_functions()
+
+    combined = None
+    for chunk_idx, window in enumerate(windows):
+        with stage_timing.time_stage(timings, 'read'):
+            chunk_pix = image_io.dataset_read_pixels(image_ds, pixel_buffer, layout, window)
+        with stage_timing.time_stage(timings, 'calculate'):
+            chunk_value = calculate_map(chunk_pix)
+            combined = chunk_value if chunk_idx == 0 else calculate_combine(combined, chunk_value)
+
+    with stage_timing.time_stage(timings, 'calculate'):
+        return calculate_finalize(combined) if calculate_finalize is not None else combined
+
+
+def process_image_files_batch(filenames: list, variable_names: list, timing: bool = False) -> list:
+    """Loads the image files, calls the algorithm with batches of same sized images, and validates the returned values
+    Arguments:
+        filenames: the paths of the image files to process
+        variable_names: the list of the names of expected variables
+        timing: set to True to record the time spent in each processing stage
+    Return:
+        Returns a list with a tuple for each file containing the same values as process_image_file(), and an error
+        message if the file couldn't be processed (None otherwise)
+    Notes:
+        Images with the same shape and data type are read into one array with an additional first dimension and passed
+        to the algorithm's calculate_batch() function, which returns a sequence with the values of each image in order,
+        or a two dimensional array with a row of values for each image.
+        The time spent calculating a batch is shared equally by its images. The array is read into the pixel buffer
+        so the algorithm shouldn't keep references to the pixels it's passed
+    """
+    # pylint: disable=too-many-locals
+    layout = algorithm_descriptor.get_algorithm_pixel_layout()
+    results = [(None, None)] * len(filenames)
+    file_timings = [{} if timing else None for _ in filenames]
+
+    datasets, geo_infos, groups = open_batch_files(filenames, layout, file_timings, results)
+    try:
+        for (shape, dtype), group_idxs in groups.items():
+            batch_pix, read_idxs = read_batch_pixels(datasets, group_idxs, shape, dtype, layout, file_timings, results)
+            if not read_idxs:
+                continue
+
+            # Make the call, sharing the time among the images, and check the results
+            batch_timings = {} if timing else None
+            try:
+                calc_values = calculate_batch_values(batch_pix[:len(read_idxs)], len(variable_names), batch_timings)
+            except Exception as ex:
+                for file_idx in read_idxs:
+                    results[file_idx] = (None, str(ex))
+                continue
+
+            for file_idx, calc_value in zip(read_idxs, calc_values):
+                if batch_timings is not None:
+                    wall_seconds, cpu_seconds = batch_timings['calculate']
+                    file_timings[file_idx]['calculate'] = (wall_seconds / len(read_idxs), cpu_seconds / len(read_idxs))
+                try:
+                    results[file_idx] = (get_image_result(filenames[file_idx], calc_value, geo_infos[file_idx],
+                                                          variable_names, file_timings[file_idx]), None)
+                except Exception as ex:
+                    results[file_idx] = (None, str(ex))
+    finally:
+        # Releasing the references closes the datasets
+        datasets = None
+
+    return results
+
+
+def open_batch_files(filenames: list, layout: str, file_timings: list, results: list) -> tuple:
+    """Opens the image files of a batch and groups them by the shape of their pixels
+    Arguments:
+        filenames: the paths of the image files to open
+        layout: the pixel layout of the algorithm
+        file_timings: the stage timings dictionary of each file; entries are None if timing isn't enabled
+        results: the list of the results of each file; the error of each file that can't be opened is set
+    Return:
+        Returns a tuple containing the list of opened datasets, the list of geo information of each file, and a
+        dictionary of (shape, data type) tuples and their lists of file indexes. Entries of files that couldn't be
+        opened are None
+    """
+    datasets = [None] * len(filenames)
+    geo_infos = [None] * len(filenames)
+    groups = {}
+    for file_idx, one_file in enumerate(filenames):
+        try:
+            with stage_timing.time_stage(file_timings[file_idx], 'open'):
+                datasets[file_idx] = image_io.open_image_dataset(one_file)
+            with stage_timing.time_stage(file_timings[file_idx], 'geo'):
+                geo_infos[file_idx] = image_io.dataset_get_geo_info(datasets[file_idx], one_file)
+            groups.setdefault(image_io.dataset_get_pixels_shape(datasets[file_idx], layout), []).append(file_idx)
+        except Exception as ex:
+            datasets[file_idx] = None
+            results[file_idx] = (None, str(ex))
+
+    return datasets, geo_infos, groups
+
+
+def read_batch_pixels(datasets: list, group_idxs: list, shape: tuple, dtype: np.dtype, layout: str, file_timings: list,
+                      results: list) -> tuple:
+    """Reads the images of a group into one array
+    Arguments:
+        datasets: the list of opened datasets; the datasets of the group are released once they're read
+        group_idxs: the indexes of the group's files
+        shape: the shape of the pixels of each image of the group
+        dtype: the data type of the pixels of the group
+        layout: the pixel layout of the algorithm
+        file_timings: the stage timings dictionary of each file; entries are None if timing isn't enabled
+        results: the list of the results of each file; the error of each file that can't be read is set
+    Return:
+        Returns a tuple containing the array the images were read into, and the list of indexes of the files that
+        were read, in the order they're in the array
+    """
+    # pylint: disable=too-many-arguments
+    batch_pix = image_io.get_pixel_buffer().get_array((len(group_idxs),) + shape, dtype)
+    read_idxs = []
+    for file_idx in group_idxs:
+        try:
+            with stage_timing.time_stage(file_timings[file_idx], 'read'):
+                image_io.dataset_read_pixels(datasets[file_idx], layout=layout, pixels=batch_pix[len(read_idxs)])
+            read_idxs.append(file_idx)
+        except Exception as ex:
+            results[file_idx] = (None, str(ex))
+        datasets[file_idx] = None
+
+    return batch_pix, read_idxs
+
+
+def calculate_batch_values(batch_pix: np.ndarray, num_variables: int, timings: Optional[dict] = None) -> list:
+    """Calls the algorithm's calculate_batch() function and checks the number of values returned
+    Arguments:
+        batch_pix: the array of the pixels of the images, with the images in the first dimension
+        num_variables: the number of expected variables
+        timings: the stage timings dictionary of the batch; None if timing isn't enabled
+    Return:
+        Returns a list with the value returned for each image
+    Exceptions:
+        RuntimeError is raised if the number of values returned doesn't match the number of images
+    """
+    # The function is optional in the algorithm so it's looked up by name
+    calculate_batch = getattr(algorithm_rgb, 'calculate_batch')
+    with stage_timing.time_stage(timings, 'calculate'):
+        calc_values = calculate_batch(batch_pix)
+
+    num_images = len(batch_pix)
+    if isinstance(calc_values, np.ndarray) and calc_values.ndim == 2:
+        # An array has a row of values for each image; the rows are copied when they're validated
+        if calc_values.shape != (num_images, num_variables):
+            raise RuntimeError("The calculate_batch() function returned an array with shape %s for %s images "
+                               "and %s variables" % (str(calc_values.shape), str(num_images), str(num_variables)))
+    calc_values = list(calc_values)
+    if len(calc_values) != num_images:
+        raise RuntimeError("The calculate_batch() function returned %s values for %s images" %
+                           (str(len(calc_values)), str(num_images)))
+
+    return calc_values
+
+
+def get_batch_result(batch_result: tuple) -> Optional[dict]:
+    """Returns the result of processing an image in a batch
+    Arguments:
+        batch_result: the image's tuple returned by process_image_files_batch()
+    Return:
+        Returns the same values as process_image_file()
+    Exceptions:
+        RuntimeError is raised if the image couldn't be processed
+    """
+    result, error = batch_result
+    if error is not None:
+        raise RuntimeError(error)
+    return result
+
+
+def iterate_batched_image_results(image_files: list, variable_names: list, num_workers: int = 1, timing: bool = False,
+                                  calculate_batch_size: int = CALCULATE_BATCH_SIZE):
+    """Generator returning each image file along with a function that returns the file's processing results,
+       processing the images in batches
+    Arguments:
+        image_files: the list of image files to process
+        variable_names: the list of the names of expected variables
+        num_workers: the number of processes to use; the batches are processed in this process when less than 2
+        timing: set to True to record the time spent in each processing stage
+        calculate_batch_size: the maximum number of images in a batch
+    Return:
+        Yields the same values as iterate_image_results()
+    """
+    calls_args = [(image_files[start_idx:start_idx + calculate_batch_size], variable_names, timing)
+                  for start_idx in range(0, len(image_files), calculate_batch_size)]
+    for call_args, get_results in iterate_call_results(process_image_files_batch, calls_args,
+                                                       num_workers):
+        try:
+            batch_results = get_results()
+        except Exception as ex:
+            batch_results = [(None, str(ex))] * len(call_args[0])
+        for one_file, batch_result in zip(call_args[0], batch_results):
+            yield one_file, functools.partial(get_batch_result, batch_result)
+
+
+def process_image_file(filename: str, variable_names: list, timing: bool = False) -> Optional[dict]:
+    """Loads the image file, calls the algorithm, and validates the returned values
+    Arguments:
+        filename: the path of the image file to process
+        variable_names: the list of the names of expected variables
+        timing: set to True to record the time spent in each processing stage
+    Return:
+        Returns None if the algorithm didn't return a value. Otherwise a dictionary is returned with the
+        validated 'values', the 'geo' information of the image as returned by dataset_get_geo_info(),
+        a list of additional 'file' paths returned by the algorithm, and the stage 'timing' dictionary
+        (None if timing isn't enabled)
+    Exceptions:
+        Exceptions raised while processing the file are passed through to the caller
+    Notes:
+        The returned dictionary only contains simple types so that it can be returned from another process
+    """
+    if algorithm_descriptor.algorithm_supports_chunks():
+        return process_image_file_chunks(filename, variable_names, timing)
+
+    geo_info, image_pix, timings = image_io.load_image_file(filename, image_io.get_pixel_buffer(),
+                                                            algorithm_descriptor.get_algorithm_pixel_layout(), timing)
+    return calculate_image_values(filename, image_pix, geo_info, variable_names, timings)
+
+
+def process_loaded_image_file(filename: str, load_future: concurrent.futures.Future, variable_names: list) -> Optional[dict]:
+    """Waits for the image file to be loaded, calls the algorithm, and validates the returned values
+    Arguments:
+        filename: the path of the image file to process
+        load_future: the future of the call to load_image_file() for the file
+        variable_names: the list of the names of expected variables
+    Return:
+        Returns the same values as process_image_file()
+    """
+    geo_info, image_pix, timings = load_future.result()
+    return calculate_image_values(filename, image_pix, geo_info, variable_names, timings)
+
+
+def iterate_prefetched_image_results(image_files: list, variable_names: list, prefetch: int, timing: bool = False):
+    """Generator returning each image file along with a function that returns the file's processing results,
+       while loading the following images on other threads
+    Arguments:
+        image_files: the list of image files to process
+        variable_names: the list of the names of expected variables
+        prefetch: the number of images to load ahead of the image being processed
+        timing: set to True to record the time spent in each processing stage
+    Return:
+        Yields the same values as iterate_image_results()
+    Notes:
+        Each image being loaded, or being processed, has its own pixel buffer so memory use is bounded by the
+        number of images loaded ahead. The returned function must be called before requesting the next file
+    """
+    layout = algorithm_descriptor.get_algorithm_pixel_layout()
+    free_buffers = [image_io.PixelBuffer() for _ in range(0, prefetch + 1)]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=prefetch) as executor:
+        pending = collections.deque()
+        files_iter = iter(image_files)
+        for one_file in files_iter:
+            pixel_buffer = free_buffers.pop()
+            pending.append((one_file, pixel_buffer,
+                            executor.submit(image_io.load_image_file, one_file, pixel_buffer, layout, timing)))
+            if len(pending) >= prefetch:
+                break
+
+        while pending:
+            one_file, pixel_buffer, future = pending.popleft()
+
+            # Start loading the next image while this one is processed
+            next_file = next(files_iter, None)
+            if next_file is not None:
+                next_buffer = free_buffers.pop()
+                pending.append((next_file, next_buffer,
+                                executor.submit(image_io.load_image_file, next_file, next_buffer, layout, timing)))
+
+            yield one_file, functools.partial(process_loaded_image_file, one_file, future, variable_names)
+            free_buffers.append(pixel_buffer)
+
+
+def iterate_call_results(function, calls_args: list, num_workers: int = 1):
+    """Generator returning each call's arguments along with a function that returns the result of the call
+    Arguments:
+        function: the function to call
+        calls_args: the list of argument tuples, one for each call to make
+        num_workers: the number of processes to use; the calls are made in this process when less than 2
+    Return:
+        Yields a tuple of the call's arguments and a function that returns the result of the call. Any exception
+        raised by the call is raised when the returned function is called
+    Notes:
+        The calls are returned in the order they're specified. When using multiple processes, the number of
+        outstanding calls is limited to a small multiple of the number of workers. If a worker process stops
+        unexpectedly, the calls that didn't complete, and the ones that weren't made yet, raise a RuntimeError
+    """
+    if num_workers < 2 or len(calls_args) < 2:
+        for call_args in calls_args:
+            yield call_args, functools.partial(function, *call_args)
+        return
+
+    max_pending = num_workers * MAX_PENDING_IMAGES_PER_WORKER
+    with concurrent.futures.ProcessPoolExecutor(max_workers=num_workers) as executor:
+        pending = collections.deque()
+        pool_error = None
+        for call_args in calls_args:
+            if pool_error is None:
+                try:
+                    pending.append((call_args, functools.partial(get_future_result,
+                                                                 executor.submit(function, *call_args))))
+                except concurrent.futures.process.BrokenProcessPool as ex:
+                    logging.error("The worker processes stopped unexpectedly, the remaining calls are not made")
+                    pool_error = ex
+            if pool_error is not None:
+                pending.append((call_args, functools.partial(raise_pool_error, pool_error)))
+            if len(pending) >= max_pending:
+                yield pending.popleft()
+
+        while pending:
+            yield pending.popleft()
+
+
+def get_future_result(future: concurrent.futures.Future):
+    """Returns the result of a call made in a worker process
+    Arguments:
+        future: the future of the call
+    Return:
+        Returns the value returned by the call
+    Exceptions:
+        RuntimeError is raised if the worker processes stopped before the call completed. Any exception raised by
+        the call is raised
+    """
+    try:
+        return future.result()
+    except concurrent.futures.process.BrokenProcessPool as ex:
+        raise RuntimeError("The worker processes stopped before the call completed: %s" % str(ex)) from ex
+
+
+def raise_pool_error(pool_error: Exception):
+    """Raises the error of a call that wasn't made because the worker processes stopped
+    Arguments:
+        pool_error: the error raised when trying to make calls
+    Exceptions:
+        RuntimeError is always raised
+    """
+    raise RuntimeError("The worker processes stopped before the call was made: %s" % str(pool_error)) from pool_error
+
+
+def iterate_image_results(image_files: list, variable_names: list, num_workers: int = 1, timing: bool = False,
+                          prefetch: int = 0, calculate_batch_size: int = CALCULATE_BATCH_SIZE):
+    """Generator returning each image file along with a function that returns the file's processing results
+    Arguments:
+        image_files: the list of image files to process
+        variable_names: the list of the names of expected variables
+        num_workers: the number of processes to use; the images are processed in this process when less than 2
+        timing: set to True to record the time spent in each processing stage
+        prefetch: the number of images to load ahead on other threads when processing images in this process; images
+                  aren't loaded ahead when the algorithm processes images in chunks or batches
+        calculate_batch_size: the maximum number of images passed to the algorithm in one call when it processes
+                              images in batches; images are processed one at a time when less than 2
+    Return:
+        Yields a tuple of the image file and a function that returns the result of process_image_file() for that
+        file. Any exception raised while processing the image is raised when the function is called
+    Notes:
+        The files are returned in the order they're specified. Algorithms that process images in chunks don't
+        process them in batches
+    """
+    # pylint: disable=too-many-arguments
+    if calculate_batch_size > 1 and algorithm_descriptor.algorithm_supports_batches() and \
+            not algorithm_descriptor.algorithm_supports_chunks():
+        yield from iterate_batched_image_results(image_files, variable_names, num_workers, timing, calculate_batch_size)
+        return
+
+    if num_workers < 2 and prefetch > 0 and len(image_files) > 1 and not algorithm_descriptor.algorithm_supports_chunks():
+        yield from iterate_prefetched_image_results(image_files, variable_names, prefetch, timing)
+        return
+
+    calls_args = [(one_file, variable_names, timing) for one_file in image_files]
+    for call_args, get_result in iterate_call_results(process_image_file, calls_args, num_workers):
+        yield call_args[0], get_result
+
+
+def get_cached_results(image_files: list, result_cache: results_cache.ResultCache) -> dict:
+    """Returns the cached results of the image files
+    Arguments:
+        image_files: the list of image files to look up
+        result_cache: the cache of previous results
+    Return:
+        Returns a dictionary of the image files found in the cache and their results
+    """
+    cached_results = {}
+    for one_file in image_files:
+        cached_result = result_cache.get_file_result(one_file)
+        if cached_result is not None:
+            cached_results[one_file] = cached_result
+    logging.info("Found %s of %s images in the results cache", str(len(cached_results)), str(len(image_files)))
+
+    return cached_results
+
+
+def iterate_result_batches(image_files: list, variable_names: list, num_workers: int = 1,
+                           batch_size: int = csv_output.RESULTS_BATCH_SIZE, timing: bool = False, prefetch: int = 0,
+                           result_cache: Optional[results_cache.ResultCache] = None,
+                           calculate_batch_size: int = CALCULATE_BATCH_SIZE):
+    """Generator returning batches of image processing results
+    Arguments:
+        image_files: the list of image files to process
+        variable_names: the list of the names of expected variables
+        num_workers: the number of processes to use; the images are processed in this process when less than 2
+        batch_size: the maximum number of results in a batch
+        timing: set to True to record the time spent in each processing stage
+        prefetch: the number of images to load ahead on other threads when processing images in this process
+        result_cache: optional cache of previous results; images found in the cache are not processed again
+        calculate_batch_size: the maximum number of images passed to the algorithm in one call when it processes
+                              images in batches
+    Return:
+        Yields lists of tuples containing the image file and the result of process_image_file() for that file
+    Notes:
+        Files that the algorithm doesn't return a value for are skipped. Errors raised while processing a file are
+        logged and the file is skipped. Errors accessing the results cache are logged: a result that can't be read
+        is processed again and a result that can't be saved isn't cached
+    """
+    # pylint: disable=too-many-arguments
+    # Find the cached results so that only the remaining files are processed
+    cached_results = get_cached_results(image_files, result_cache) if result_cache is not None else {}
+    process_iter = iterate_image_results([one_file for one_file in image_files if one_file not in cached_results],
+                                         variable_names, num_workers, timing, prefetch, calculate_batch_size)
+
+    batch = []
+    for one_file in image_files:
+        if one_file in cached_results:
+            result = cached_results[one_file]
+        else:
+            # The processed files are returned in order
+            _, get_result = next(process_iter, (None, None))
+            if get_result is None:
+                raise RuntimeError("No processing result was returned for file: '%s'" % one_file)
+            try:
+                result = result_cache.compute_file_result(one_file, get_result) if result_cache is not None else get_result()
+            except Exception as ex:
+                logging.error("Error generating %s for %s", algorithm_descriptor.get_algorithm_name(),
+                              plots.get_plot_name(one_file))
+                logging.error("Exception: %s", str(ex))
+                continue
+
+        if result is None:
+            continue
+
+        batch.append((one_file, result))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+
+    if batch:
+        yield batch
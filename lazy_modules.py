@@ -0,0 +1,37 @@
+"""Modules that are only imported when they're first used
+"""
+import importlib
+
+
+class LazyModule:
+    """Module that's imported the first time one of its attributes is used"""
+    # pylint: disable=too-few-public-methods
+
+    def __init__(self, name: str):
+        """Initializes the module without importing it
+        Arguments:
+            name: the full name of the module to import
+        """
+        self.lazy_name = name
+        self.lazy_module = None
+
+    def __getattr__(self, attr_name: str):
+        """Imports the module if needed and returns the requested attribute
+        Arguments:
+            attr_name: the name of the attribute to return
+        """
+        if self.lazy_module is None:
+            self.lazy_module = importlib.import_module(self.lazy_name)
+        return getattr(self.lazy_module, attr_name)
+
+
+# GDAL takes a noticeable time to load so it's only imported when it's used, keeping startup fast for short runs
+# and for only showing help. Modules that use these in annotations import annotations from __future__ so that the
+# annotations aren't evaluated, and GDAL isn't loaded, when their functions are defined
+# pylint: disable=invalid-name
+osgeo = LazyModule('osgeo')
+gdal = LazyModule('osgeo.gdal')
+gdal_array = LazyModule('osgeo.gdal_array')
+ogr = LazyModule('osgeo.ogr')
+osr = LazyModule('osgeo.osr')
+# pylint: enable=invalid-name
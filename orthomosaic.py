@@ -0,0 +1,169 @@
+"""Clipping plots from orthomosaics and running the algorithm on them
+"""
+from __future__ import annotations
+
+import logging
+from typing import Optional
+
+import algorithm_descriptor
+import csv_output
+import image_io
+import image_processing
+import plots
+import stage_timing
+from lazy_modules import gdal
+
+# The orthomosaic file name and dataset kept open in this process when clipping plots
+ORTHOMOSAIC_DATASET = None
+
+
+def get_orthomosaic_plot_windows(filename: str, plot_index: plots.PlotIndex) -> list:
+    """Returns the windows of the plots found in the orthomosaic image
+    Arguments:
+        filename: the path of the orthomosaic image file
+        plot_index: the index of the plot boundaries
+    Return:
+        Returns a list of (plot name, window, window geo information) tuples for the plots that overlap the image
+    Exceptions:
+        RuntimeError is raised if the image isn't geo-referenced
+    """
+    image_ds = image_io.open_image_dataset(filename)
+    try:
+        geo_info = image_io.dataset_get_geo_info(image_ds, filename)
+        bounds = image_io.dataset_get_geobounds(image_ds, filename)
+    finally:
+        image_ds = None
+    if geo_info is None:
+        raise RuntimeError("Unable to clip plots from an image that isn't geo-referenced: '%s'" % filename)
+
+    footprint = image_io.get_footprint_latlon(bounds, geo_info[0])
+    plot_boundaries = plot_index.find_intersecting(footprint) if footprint is not None else plot_index.plots
+
+    plot_windows = []
+    for plot_name, plot_geom in plot_boundaries:
+        try:
+            window = plots.get_geometry_window(plot_geom, geo_info)
+        except Exception as ex:
+            logging.error("Unable to find plot '%s' in image: '%s'", plot_name, filename)
+            logging.error("Exception: %s", str(ex))
+            continue
+        if window is None:
+            logging.debug("Plot '%s' is not in image: '%s'", plot_name, filename)
+            continue
+        plot_windows.append((plot_name, window, plots.get_window_geo_info(geo_info, window)))
+
+    return plot_windows
+
+
+def get_orthomosaic_dataset(filename: str) -> gdal.Dataset:
+    """Returns the opened orthomosaic dataset, keeping the most recently used one open in this process
+    Arguments:
+        filename: the path of the orthomosaic image file
+    Return:
+        Returns the opened dataset
+    """
+    # pylint: disable=global-statement
+    global ORTHOMOSAIC_DATASET
+
+    if ORTHOMOSAIC_DATASET is None or ORTHOMOSAIC_DATASET[0] != filename:
+        ORTHOMOSAIC_DATASET = None
+        ORTHOMOSAIC_DATASET = (filename, image_io.open_image_dataset(filename))
+
+    return ORTHOMOSAIC_DATASET[1]
+
+
+def release_orthomosaic_dataset() -> None:
+    """Closes the orthomosaic dataset kept open in this process
+    """
+    # pylint: disable=global-statement
+    global ORTHOMOSAIC_DATASET
+
+    ORTHOMOSAIC_DATASET = None
+
+
+def process_plot_window(filename: str, plot_name: str, window: tuple, geo_info: tuple, variable_names: list,
+                        timing: bool = False) -> Optional[dict]:
+    """Reads a plot from the orthomosaic, calls the algorithm, and validates the returned values
+    Arguments:
+        filename: the path of the orthomosaic image file
+        plot_name: the name of the plot
+        window: the (x offset, y offset, x size, y size) window of the plot in the orthomosaic
+        geo_info: the geo information of the plot's window
+        variable_names: the list of the names of expected variables
+        timing: set to True to record the time spent in each processing stage
+    Return:
+        Returns the same values as process_image_file() with the addition of the 'plot' name
+    """
+    # pylint: disable=too-many-arguments
+    timings = {} if timing else None
+    with stage_timing.time_stage(timings, 'open'):
+        image_ds = get_orthomosaic_dataset(filename)
+
+    if algorithm_descriptor.algorithm_supports_chunks():
+        # Large plots are read in chunks the same as large images
+        chunk_windows = image_io.dataset_get_chunk_windows(image_ds, window=window)
+        calc_value = image_processing.calculate_dataset_chunks(image_ds, chunk_windows, timings)
+        result = image_processing.get_image_result(filename, calc_value, geo_info, variable_names, timings)
+    else:
+        with stage_timing.time_stage(timings, 'read'):
+            image_pix = image_io.dataset_read_pixels(image_ds, image_io.get_pixel_buffer(),
+                                                     algorithm_descriptor.get_algorithm_pixel_layout(), window)
+        result = image_processing.calculate_image_values(filename, image_pix, geo_info, variable_names, timings)
+    image_ds = None
+    if result is not None:
+        result['plot'] = plot_name
+    return result
+
+
+def iterate_plot_result_batches(image_files: list, plot_index: plots.PlotIndex, variable_names: list, num_workers: int = 1,
+                                batch_size: int = csv_output.RESULTS_BATCH_SIZE, timing: bool = False):
+    """Generator returning batches of the processing results of plots clipped from orthomosaics
+    Arguments:
+        image_files: the list of orthomosaic image files to clip plots from
+        plot_index: the index of the plot boundaries
+        variable_names: the list of the names of expected variables
+        num_workers: the number of processes to use; the plots are processed in this process when less than 2
+        batch_size: the maximum number of results in a batch
+        timing: set to True to record the time spent in each processing stage
+    Return:
+        Yields lists of tuples containing the orthomosaic image file and the result of process_plot_window() for a plot
+    Notes:
+        Only the pixels of each plot's bounding box are read from the orthomosaic. Plots that the algorithm doesn't
+        return a value for are skipped. Errors raised while processing a plot are logged and the plot is skipped
+    """
+    # pylint: disable=too-many-arguments
+    calls_args = []
+    for one_file in image_files:
+        try:
+            plot_windows = get_orthomosaic_plot_windows(one_file, plot_index)
+        except Exception as ex:
+            logging.error("Unable to clip plots from image: '%s'", one_file)
+            logging.error("Exception: %s", str(ex))
+            continue
+        logging.info("Found %s plots in image: '%s'", str(len(plot_windows)), one_file)
+        calls_args.extend([(one_file, plot_name, window, window_geo_info, variable_names, timing)
+                           for plot_name, window, window_geo_info in plot_windows])
+
+    batch = []
+    try:
+        for call_args, get_result in image_processing.iterate_call_results(process_plot_window, calls_args,
+                                                                           num_workers):
+            try:
+                result = get_result()
+            except Exception as ex:
+                logging.error("Error generating %s for %s", algorithm_descriptor.get_algorithm_name(), call_args[1])
+                logging.error("Exception: %s", str(ex))
+                continue
+
+            if result is None:
+                continue
+
+            batch.append((call_args[0], result))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    finally:
+        release_orthomosaic_dataset()
+
+    if batch:
+        yield batch
@@ -0,0 +1,262 @@
+"""Plot names and boundaries
+"""
+from __future__ import annotations
+
+import json
+import logging
+import math
+import os
+from typing import Optional
+import numpy as np
+
+import image_io
+from lazy_modules import ogr
+
+
+def find_footprint_plot_name(filename: str, geo_info: Optional[tuple], plot_index: 'PlotIndex') -> str:
+    """Returns the name of the plot that overlaps the image the most
+    Arguments:
+        filename: the path of the image file
+        geo_info: the geo information of the image as returned by dataset_get_geo_info()
+        plot_index: the index of the plot boundaries
+    Return:
+        Returns the name of the plot, or the plot name from the file's path if a plot isn't found
+    """
+    plot_name = None
+    if geo_info is not None:
+        epsg, geo_transform, raster_x_size, raster_y_size = geo_info
+        footprint = image_io.get_footprint_latlon(image_io.get_geobounds(geo_transform, raster_x_size,
+                                                                         raster_y_size), epsg)
+        if footprint is not None:
+            plot_name = plot_index.find_plot_name(footprint)
+
+    if plot_name is None:
+        logging.debug("Plot not found using the footprint of image, using its path: '%s'", filename)
+        plot_name = get_plot_name(filename)
+    return plot_name
+
+
+def get_plot_boundaries(full_md: list) -> list:
+    """Returns the plot boundaries found in the metadata
+    Arguments:
+        full_md: the full list of metadata
+    Return:
+        Returns a list of (plot name, geometry) tuples. The geometries have their spatial reference assigned
+    Notes:
+        Plots are found in the 'plots' entries of the metadata. Each plot with a 'name' and a 'geometry' is returned;
+        the geometry can be GeoJSON (as a dictionary or a string) or WKT. The coordinates are in lat-lon unless the plot
+        has an 'epsg' entry specifying the EPSG code. If a plot name is found more than once, the first one is used
+    """
+    plots = []
+    found_names = set()
+    for one_md in full_md:
+        if 'plots' not in one_md:
+            continue
+        for one_plot in one_md['plots']:
+            if 'name' not in one_plot or 'geometry' not in one_plot:
+                continue
+            plot_name = str(one_plot['name'])
+            if plot_name in found_names:
+                continue
+
+            geometry = one_plot['geometry']
+            if isinstance(geometry, dict):
+                plot_geom = ogr.CreateGeometryFromJson(json.dumps(geometry))
+            elif str(geometry).lstrip().startswith('{'):
+                plot_geom = ogr.CreateGeometryFromJson(str(geometry))
+            else:
+                plot_geom = ogr.CreateGeometryFromWkt(str(geometry))
+            if plot_geom is None:
+                logging.warning("Unable to load the geometry of plot '%s', skipping plot", plot_name)
+                continue
+
+            epsg = int(one_plot['epsg']) if 'epsg' in one_plot and one_plot['epsg'] else image_io.LAT_LON_EPSG_CODE
+            plot_geom.AssignSpatialReference(image_io.get_latlon_transformation(epsg)[0])
+
+            found_names.add(plot_name)
+            plots.append((plot_name, plot_geom))
+
+    return plots
+
+
+def get_geometry_window(geometry: ogr.Geometry, geo_info: tuple) -> Optional[tuple]:
+    """Returns the pixel window of an image that contains the geometry
+    Arguments:
+        geometry: the geometry to find the window of; must have its spatial reference assigned
+        geo_info: the geo information of the image as returned by dataset_get_geo_info()
+    Return:
+        Returns the (x offset, y offset, x size, y size) window of the image containing the geometry's bounding box,
+        or None if the geometry doesn't overlap the image
+    Exceptions:
+        RuntimeError is raised if the image is rotated or the geometry can't be converted to the image's coordinates
+    """
+    epsg, geo_transform, raster_x_size, raster_y_size = geo_info
+    if geo_transform[2] or geo_transform[4]:
+        raise RuntimeError("Rotated images are not supported when clipping plots")
+
+    image_ref_sys, _, _ = image_io.get_latlon_transformation(epsg)
+    image_geom = geometry.Clone()
+    if not image_geom.GetSpatialReference().IsSame(image_ref_sys):
+        if image_geom.TransformTo(image_ref_sys) != ogr.OGRERR_NONE:
+            raise RuntimeError("Unable to convert plot geometry to EPSG %s" % str(epsg))
+    envelope = image_geom.GetEnvelope()
+
+    x_off, x_end = get_envelope_pixel_range(envelope[0:2], geo_transform[0], geo_transform[1], raster_x_size)
+    y_off, y_end = get_envelope_pixel_range(envelope[2:4], geo_transform[3], geo_transform[5], raster_y_size)
+    if x_end <= x_off or y_end <= y_off:
+        return None
+
+    return x_off, y_off, x_end - x_off, y_end - y_off
+
+
+def get_envelope_pixel_range(coordinates: tuple, origin: float, pixel_size: float, raster_size: int) -> tuple:
+    """Returns the range of pixels along one axis of an image that contains the coordinates
+    Arguments:
+        coordinates: the (minimum, maximum) coordinates along the axis
+        origin: the coordinate of the image's first pixel edge along the axis
+        pixel_size: the size of a pixel along the axis; negative when the coordinates decrease as pixels increase
+        raster_size: the number of pixels of the image along the axis
+    Return:
+        Returns a tuple of the first pixel and the pixel following the last one, clipped to the image
+    """
+    pixels = sorted([(coordinates[0] - origin) / pixel_size, (coordinates[1] - origin) / pixel_size])
+    return max(0, int(math.floor(pixels[0]))), min(raster_size, int(math.ceil(pixels[1])))
+
+
+def get_window_geo_info(geo_info: tuple, window: tuple) -> tuple:
+    """Returns the geo information of a window of an image
+    Arguments:
+        geo_info: the geo information of the image as returned by dataset_get_geo_info()
+        window: the (x offset, y offset, x size, y size) window of the image
+    Return:
+        Returns the geo information of the window in the same form as dataset_get_geo_info()
+    """
+    epsg, geo_transform, _, _ = geo_info
+    x_off, y_off, x_size, y_size = window
+    window_transform = (geo_transform[0] + x_off * geo_transform[1] + y_off * geo_transform[2], geo_transform[1],
+                        geo_transform[2], geo_transform[3] + x_off * geo_transform[4] + y_off * geo_transform[5],
+                        geo_transform[4], geo_transform[5])
+    return epsg, window_transform, x_size, y_size
+
+
+def get_plot_name(filename: str) -> str:
+    """Returns the name of the plot associated with the image file
+    Arguments:
+        filename: the path of the plot image file
+    Return:
+        Returns the name of the folder containing the file
+    """
+    return os.path.basename(os.path.dirname(filename))
+
+
+class PlotIndex:
+    """Grid index of plot boundaries for finding the plots that intersect a geometry"""
+
+    def __init__(self, plot_boundaries: list):
+        """Initializes the index
+        Arguments:
+            plot_boundaries: the list of (plot name, geometry) tuples as returned by get_plot_boundaries()
+        Notes:
+            The plot geometries are indexed in lat-lon using square cells sized to the typical plot, so each plot is
+            found in a small number of cells. Plots that can't be converted to lat-lon are not indexed
+        """
+        self.plots = []
+        self.latlon_geometries = []
+        self.cells = {}
+        self.cell_size = 1.0
+
+        _, dest_spatial, _ = image_io.get_latlon_transformation(image_io.LAT_LON_EPSG_CODE)
+        envelopes = []
+        for plot_name, plot_geom in plot_boundaries:
+            latlon_geom = plot_geom.Clone()
+            if not latlon_geom.GetSpatialReference().IsSame(dest_spatial):
+                if latlon_geom.TransformTo(dest_spatial) != ogr.OGRERR_NONE:
+                    logging.warning("Unable to convert plot '%s' to lat-lon, plot is not indexed", plot_name)
+                    continue
+            self.plots.append((plot_name, plot_geom))
+            self.latlon_geometries.append(latlon_geom)
+            envelopes.append(latlon_geom.GetEnvelope())
+        if not envelopes:
+            return
+
+        envelopes = np.array(envelopes)
+        plot_sizes = np.maximum(envelopes[:, 1] - envelopes[:, 0], envelopes[:, 3] - envelopes[:, 2])
+        median_size = float(np.median(plot_sizes))
+        if median_size > 0:
+            self.cell_size = median_size
+
+        for plot_idx, (min_x, max_x, min_y, max_y) in enumerate(envelopes.tolist()):
+            for cell in self._get_cells(min_x, max_x, min_y, max_y):
+                self.cells.setdefault(cell, []).append(plot_idx)
+
+    def _get_cell_range(self, min_x: float, max_x: float, min_y: float, max_y: float) -> tuple:
+        """Returns the range of cells covering a bounding box
+        Arguments:
+            min_x, max_x, min_y, max_y: the bounding box
+        Return:
+            Returns the minimum column, maximum column, minimum row, and maximum row of the cells
+        """
+        return (int(math.floor(min_x / self.cell_size)), int(math.floor(max_x / self.cell_size)),
+                int(math.floor(min_y / self.cell_size)), int(math.floor(max_y / self.cell_size)))
+
+    def _get_cells(self, min_x: float, max_x: float, min_y: float, max_y: float):
+        """Generator returning the cells covering a bounding box
+        Arguments:
+            min_x, max_x, min_y, max_y: the bounding box
+        Return:
+            Yields the (column, row) of each cell
+        """
+        min_col, max_col, min_row, max_row = self._get_cell_range(min_x, max_x, min_y, max_y)
+        for col in range(min_col, max_col + 1):
+            for row in range(min_row, max_row + 1):
+                yield col, row
+
+    def find_candidates(self, min_x: float, max_x: float, min_y: float, max_y: float) -> list:
+        """Returns the indexes of the plots whose cells overlap a lat-lon bounding box
+        Arguments:
+            min_x, max_x, min_y, max_y: the bounding box
+        Return:
+            Returns the sorted list of plot indexes
+        """
+        min_col, max_col, min_row, max_row = self._get_cell_range(min_x, max_x, min_y, max_y)
+        if (max_col - min_col + 1) * (max_row - min_row + 1) > len(self.cells):
+            # The box covers more cells than are used, check the used ones instead
+            cells = [cell for cell in self.cells if min_col <= cell[0] <= max_col and min_row <= cell[1] <= max_row]
+        else:
+            cells = [cell for cell in self._get_cells(min_x, max_x, min_y, max_y) if cell in self.cells]
+
+        candidates = set()
+        for cell in cells:
+            candidates.update(self.cells[cell])
+        return sorted(candidates)
+
+    def find_intersecting(self, geometry: ogr.Geometry) -> list:
+        """Returns the plots that intersect a lat-lon geometry
+        Arguments:
+            geometry: the geometry to find the plots of
+        Return:
+            Returns the list of (plot name, geometry) tuples of the intersecting plots in the order they were indexed
+        """
+        min_x, max_x, min_y, max_y = geometry.GetEnvelope()
+        return [self.plots[plot_idx] for plot_idx in self.find_candidates(min_x, max_x, min_y, max_y)
+                if self.latlon_geometries[plot_idx].Intersects(geometry)]
+
+    def find_plot_name(self, geometry: ogr.Geometry) -> Optional[str]:
+        """Returns the name of the plot that overlaps a lat-lon geometry the most
+        Arguments:
+            geometry: the geometry to find the plot of
+        Return:
+            Returns the name of the plot, or None if no plots intersect the geometry
+        """
+        min_x, max_x, min_y, max_y = geometry.GetEnvelope()
+        found_name = None
+        found_area = -1.0
+        for plot_idx in self.find_candidates(min_x, max_x, min_y, max_y):
+            intersection = self.latlon_geometries[plot_idx].Intersection(geometry)
+            if intersection is None or intersection.IsEmpty():
+                continue
+            if intersection.GetArea() > found_area:
+                found_name = self.plots[plot_idx][0]
+                found_area = intersection.GetArea()
+
+        return found_name
@@ -0,0 +1,206 @@
+"""Cache of the results of previously processed files
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+from typing import Optional
+import numpy as np
+
+import algorithm_descriptor
+
+# Default maximum size of the results cache
+RESULT_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# Number of bytes from the start and end of a file that are hashed for the results cache key
+RESULT_CACHE_HASH_BYTES = 64 * 1024
+
+# Number of changes made to the results cache before they're committed
+RESULT_CACHE_COMMIT_COUNT = 100
+
+
+class ResultCache:
+    """On-disk cache of image processing results, with least recently used eviction"""
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, path: str, variable_names: list, max_bytes: int = RESULT_CACHE_MAX_BYTES, use_hash: bool = False):
+        """Opens the cache, creating it if needed
+        Arguments:
+            path: the path of the cache database file
+            variable_names: the list of the names of the variables returned by the algorithm
+            max_bytes: the maximum size of the cached results
+            use_hash: set to True to include a hash of the start and end of each file's contents in the cache key
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.use_hash = use_hash
+        self.hits = 0
+        self.misses = 0
+        self.pending_writes = 0
+        self.file_keys = {}
+        descriptor = algorithm_descriptor.get_algorithm_descriptor()
+        self.algorithm_key = [descriptor.metadata_name, descriptor.version, list(variable_names)]
+
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value TEXT NOT NULL, '
+                                'size INTEGER NOT NULL, last_used REAL NOT NULL)')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)')
+        self.connection.commit()
+        self.num_bytes = self.connection.execute('SELECT COALESCE(SUM(size), 0) FROM results').fetchone()[0]
+
+    def get_key(self, filename: str) -> Optional[str]:
+        """Returns the cache key of the image file
+        Arguments:
+            filename: the path of the image file
+        Return:
+            Returns the key or None if the file can't be accessed
+        """
+        try:
+            file_stat = os.stat(filename)
+            key_parts = [os.path.abspath(filename), file_stat.st_size, file_stat.st_mtime_ns, self.algorithm_key]
+            if self.use_hash:
+                content_hash = hashlib.blake2b()
+                with open(filename, 'rb') as in_file:
+                    content_hash.update(in_file.read(RESULT_CACHE_HASH_BYTES))
+                    if file_stat.st_size > RESULT_CACHE_HASH_BYTES:
+                        in_file.seek(max(RESULT_CACHE_HASH_BYTES, file_stat.st_size - RESULT_CACHE_HASH_BYTES))
+                        content_hash.update(in_file.read(RESULT_CACHE_HASH_BYTES))
+                key_parts.append(content_hash.hexdigest())
+        except Exception as ex:
+            logging.warning("Unable to determine the results cache key of file: '%s'", filename)
+            logging.warning("Exception: %s", str(ex))
+            return None
+
+        return hashlib.sha256(json.dumps(key_parts).encode('utf-8')).hexdigest()
+
+    def get(self, key: Optional[str]) -> Optional[dict]:
+        """Returns the cached result
+        Arguments:
+            key: the key of the result as returned by get_key()
+        Return:
+            Returns the cached result or None if it's not cached
+        """
+        row = None
+        if key:
+            row = self.connection.execute('SELECT value FROM results WHERE key=?', (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.connection.execute('UPDATE results SET last_used=? WHERE key=?', (time.time(), key))
+        self._wrote()
+        result = json.loads(row[0])
+        result['timing'] = None
+        return result
+
+    def put(self, key: str, result: dict) -> None:
+        """Adds the result to the cache
+        Arguments:
+            key: the key of the result as returned by get_key()
+            result: the result of processing the image as returned by process_image_file()
+        Notes:
+            Results that can't be saved are logged and not cached
+        """
+        try:
+            value = json.dumps({'values': result['values'], 'geo': result['geo'], 'file': result['file']},
+                               default=ResultCache._json_default)
+        except Exception as ex:
+            logging.debug("Unable to cache result: %s", str(ex))
+            return
+
+        self.connection.execute('INSERT OR REPLACE INTO results (key, value, size, last_used) VALUES (?, ?, ?, ?)',
+                                (key, value, len(value), time.time()))
+        self.num_bytes += len(value)
+        self._wrote()
+        if self.num_bytes > self.max_bytes:
+            self.evict()
+
+    def get_file_result(self, filename: str) -> Optional[dict]:
+        """Returns the cached result of the image file
+        Arguments:
+            filename: the path of the image file
+        Return:
+            Returns the cached result or None if it's not cached or the cache can't be read
+        Notes:
+            The cache may be shared and locked by another process; errors reading it are logged and counted as misses
+        """
+        key = self.get_key(filename)
+        self.file_keys[filename] = key
+        try:
+            return self.get(key)
+        except sqlite3.Error as ex:
+            logging.warning("Unable to read the results cache for file: '%s'", filename)
+            logging.warning("Exception: %s", str(ex))
+            self.misses += 1
+            return None
+
+    def compute_file_result(self, filename: str, compute) -> Optional[dict]:
+        """Returns the result of processing the image file and adds it to the cache
+        Arguments:
+            filename: the path of the image file
+            compute: the function to call that returns the result of processing the file
+        Return:
+            Returns the result returned by the function
+        Notes:
+            Any exception raised by the function is raised. Errors saving the result are logged and the result isn't
+            cached
+        """
+        result = compute()
+        key = self.file_keys[filename] if filename in self.file_keys else self.get_key(filename)
+        if result is not None and key:
+            try:
+                self.put(key, result)
+            except sqlite3.Error as ex:
+                logging.warning("Unable to save the result of file to the results cache: '%s'", filename)
+                logging.warning("Exception: %s", str(ex))
+        return result
+
+    def evict(self) -> None:
+        """Removes the least recently used results until the cache is within its maximum size
+        """
+        self.num_bytes = self.connection.execute('SELECT COALESCE(SUM(size), 0) FROM results').fetchone()[0]
+        if self.num_bytes <= self.max_bytes:
+            return
+
+        remove_keys = []
+        for key, size in self.connection.execute('SELECT key, size FROM results ORDER BY last_used'):
+            if self.num_bytes <= self.max_bytes:
+                break
+            remove_keys.append((key,))
+            self.num_bytes -= size
+
+        logging.debug("Evicting %s results from the results cache", str(len(remove_keys)))
+        self.connection.executemany('DELETE FROM results WHERE key=?', remove_keys)
+        self.connection.commit()
+        self.pending_writes = 0
+
+    def close(self) -> None:
+        """Saves any changes and closes the cache
+        """
+        self.connection.commit()
+        self.connection.close()
+
+    def _wrote(self) -> None:
+        """Commits changes to the cache periodically
+        """
+        self.pending_writes += 1
+        if self.pending_writes >= RESULT_CACHE_COMMIT_COUNT:
+            self.connection.commit()
+            self.pending_writes = 0
+
+    @staticmethod
+    def _json_default(value):
+        """Converts numpy values for saving to the cache
+        Arguments:
+            value: the value to convert
+        Return:
+            Returns the converted value
+        Exceptions:
+            TypeError is raised if the value can't be converted
+        """
+        if isinstance(value, (np.generic, np.ndarray)):
+            return value.tolist()
+        raise TypeError("Unable to cache value of type %s" % type(value).__name__)
@@ -0,0 +1,235 @@
+"""Daemon that processes the jobs placed in a spool folder
+"""
+import argparse
+import contextlib
+import json
+import logging
+import os
+import time
+from typing import Optional
+from agpypeline import entrypoint
+
+from configuration import ConfigurationRgbBase
+
+# Number of seconds between checks of the spool folder for new jobs when running as a daemon
+DAEMON_POLL_SECONDS = 1.0
+
+# Default number of seconds after being claimed that a job still running when a daemon starts is considered abandoned by
+# a daemon that stopped
+DAEMON_STALE_SECONDS = 24 * 60 * 60
+
+# File extension of job files in the daemon's spool folder, and the extensions jobs are renamed to as they're processed
+SPOOL_JOB_EXT = '.job'
+SPOOL_RUNNING_EXT = '.running'
+SPOOL_DONE_EXT = '.done'
+SPOOL_FAILED_EXT = '.failed'
+
+
+class SpoolJobArgumentParser(argparse.ArgumentParser):
+    """Argument parser that parses the command line arguments of a spool job instead of those of the process"""
+
+    def __init__(self, job_args: list, **kwargs):
+        """Initializes the parser
+        Arguments:
+            job_args: the command line arguments of the job
+            kwargs: the arguments to initialize the argparse.ArgumentParser with
+        """
+        super().__init__(**kwargs)
+        self.job_args = job_args
+
+    def parse_args(self, args=None, namespace=None):
+        """Parses the arguments, using the job's arguments if none are specified
+        Arguments:
+            args: the arguments to parse; the job's arguments are used if None
+            namespace: the object to hold the parsed arguments
+        """
+        return super().parse_args(self.job_args if args is None else args, namespace)
+
+
+class SpoolDaemon:
+    """Long running processing of jobs placed in a spool folder, keeping the transformer and GDAL loaded between jobs"""
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, spool_folder: str, default_args: list, configuration: ConfigurationRgbBase,
+                 transformer: 'RgbPlotBase', poll_seconds: float = DAEMON_POLL_SECONDS,
+                 stale_seconds: float = DAEMON_STALE_SECONDS):
+        """Initializes the daemon
+        Arguments:
+            spool_folder: the folder to look for job files in
+            default_args: the command line arguments to use with every job, before the job's own arguments
+            configuration: the transformer configuration
+            transformer: the transformer instance used for all jobs
+            poll_seconds: the number of seconds to wait between checks for new jobs
+            stale_seconds: the number of seconds after being claimed that a job still running when the daemon starts
+                           is considered abandoned; 0 to consider all running jobs abandoned
+        """
+        # pylint: disable=too-many-arguments
+        self.spool_folder = spool_folder
+        self.default_args = default_args
+        self.configuration = configuration
+        self.transformer = transformer
+        self.poll_seconds = poll_seconds
+        self.stale_seconds = stale_seconds
+        self.stopping = False
+        self.jobs_run = 0
+
+    def stop(self, *_) -> None:
+        """Requests the daemon to stop after the current job; can be used as a signal handler
+        """
+        logging.info("Stopping after the current job")
+        self.stopping = True
+
+    def claim_job(self) -> Optional[str]:
+        """Claims the oldest job in the spool folder
+        Return:
+            Returns the path of the claimed job file, or None if there are no jobs to claim
+        Notes:
+            Jobs are claimed by renaming them, so many daemons can share the same spool folder
+        """
+        job_files = []
+        for one_name in os.listdir(self.spool_folder):
+            if one_name.endswith(SPOOL_JOB_EXT):
+                one_path = os.path.join(self.spool_folder, one_name)
+                try:
+                    job_files.append((os.path.getmtime(one_path), one_path))
+                except OSError:
+                    continue
+
+        for _, one_path in sorted(job_files):
+            running_path = os.path.splitext(one_path)[0] + SPOOL_RUNNING_EXT
+            try:
+                os.rename(one_path, running_path)
+            except OSError:
+                # Claimed by another daemon
+                continue
+
+            # The modification time of a running job is when it was claimed
+            with contextlib.suppress(OSError):
+                os.utime(running_path)
+            return running_path
+
+        return None
+
+    def fail_stale_jobs(self) -> int:
+        """Marks the jobs that were abandoned by daemons that stopped while running them as failed
+        Return:
+            Returns the number of jobs that were marked as failed
+        Notes:
+            Running jobs that were claimed more than the stale number of seconds ago are considered abandoned. They're
+            not run again since they may be what caused their daemon to stop. The job files are rewritten with an
+            'exit_code' of -1 and the 'error', and renamed with the failed extension
+        """
+        now = time.time()
+        num_failed = 0
+        for one_name in os.listdir(self.spool_folder):
+            if not one_name.endswith(SPOOL_RUNNING_EXT):
+                continue
+            running_path = os.path.join(self.spool_folder, one_name)
+            failed_path = os.path.splitext(running_path)[0] + SPOOL_FAILED_EXT
+            try:
+                if self.stale_seconds > 0 and now - os.path.getmtime(running_path) < self.stale_seconds:
+                    continue
+                # Renaming the job first keeps other daemons that are starting from also failing it
+                os.rename(running_path, failed_path)
+            except OSError:
+                continue
+
+            logging.warning("Marking job '%s' as failed since it was abandoned while running", running_path)
+            num_failed += 1
+            try:
+                with open(failed_path, 'r', encoding='utf-8') as in_file:
+                    job = json.load(in_file)
+                if isinstance(job, dict):
+                    job['exit_code'] = -1
+                    job['error'] = "The daemon running the job stopped before the job was complete"
+                    with open(failed_path, 'w', encoding='utf-8') as out_file:
+                        json.dump(job, out_file, indent=2)
+            except (OSError, ValueError) as ex:
+                logging.error("Unable to record the status of job '%s'", failed_path)
+                logging.error("Exception: %s", str(ex))
+
+        return num_failed
+
+    @staticmethod
+    def get_result_status(result) -> tuple:
+        """Returns the exit code and error of a job from the result of processing
+        Arguments:
+            result: the dictionary returned by processing the job
+        Return:
+            Returns a tuple of the exit code, which is 0 if processing succeeded, and the error message or None
+        """
+        if not isinstance(result, dict):
+            return -1, "Processing didn't return a result"
+
+        code = result.get('code', 0)
+        if 'error' in result:
+            return (code if isinstance(code, int) and code != 0 else -1), str(result['error'])
+        if code != 0:
+            return (code if isinstance(code, int) else -1), "Processing returned a code of " + str(code)
+        return 0, None
+
+    def run_job(self, running_path: str) -> int:
+        """Runs the claimed job and records its status
+        Arguments:
+            running_path: the path of the claimed job file
+        Return:
+            Returns the exit code of the job
+        Notes:
+            The job file contains a JSON object with an 'args' list of command line arguments, as they'd be passed
+            to the transformer when it's run directly. When the job is complete the file is rewritten with the
+            'exit_code' added, along with the 'error' if one occurred, and renamed with the done or failed extension.
+            A job fails if its arguments aren't valid, or if the result of processing has an error or a non-zero code
+        """
+        job = None
+        exit_code = 0
+        error = None
+        try:
+            with open(running_path, 'r', encoding='utf-8') as in_file:
+                job = json.load(in_file)
+            if not isinstance(job, dict):
+                raise RuntimeError("Job file doesn't contain a JSON object")
+            job_args = [str(one_arg) for one_arg in job.get('args', [])]
+            logging.info("Running job '%s' with arguments: %s", running_path, str(job_args))
+
+            parser = SpoolJobArgumentParser(self.default_args + job_args,
+                                            description=self.configuration.transformer_description)
+            try:
+                result = entrypoint.do_work(parser, self.configuration, self.transformer)
+                exit_code, error = SpoolDaemon.get_result_status(result)
+            except SystemExit as ex:
+                # Raised when the job's arguments aren't valid
+                exit_code = ex.code if isinstance(ex.code, int) else (0 if ex.code is None else 1)
+        except Exception as ex:
+            logging.error("Exception caught running job '%s'", running_path)
+            logging.error("Exception: %s", str(ex))
+            exit_code = -1
+            error = str(ex)
+
+        try:
+            # Job files that couldn't be loaded are left unchanged
+            if isinstance(job, dict):
+                job['exit_code'] = exit_code
+                if error is not None:
+                    job['error'] = error
+                with open(running_path, 'w', encoding='utf-8') as out_file:
+                    json.dump(job, out_file, indent=2)
+            os.rename(running_path, os.path.splitext(running_path)[0] + (SPOOL_DONE_EXT if exit_code == 0 else SPOOL_FAILED_EXT))
+        except OSError as ex:
+            logging.error("Unable to record the status of job '%s'", running_path)
+            logging.error("Exception: %s", str(ex))
+
+        self.jobs_run += 1
+        return exit_code
+
+    def run(self) -> None:
+        """Processes jobs as they're placed in the spool folder until the daemon is stopped
+        """
+        self.fail_stale_jobs()
+        logging.info("Waiting for jobs in spool folder: '%s'", self.spool_folder)
+        while not self.stopping:
+            running_path = self.claim_job()
+            if running_path is None:
+                time.sleep(self.poll_seconds)
+                continue
+            self.run_job(running_path)
+        logging.info("Daemon stopped after running %s jobs", str(self.jobs_run))
@@ -0,0 +1,77 @@
+"""Timing of the processing stages
+"""
+import contextlib
+import csv
+import time
+from typing import Optional
+import numpy as np
+
+# Names of the processing stages that are timed, in processing order
+TIMING_STAGE_NAMES = ['open', 'geo', 'read', 'calculate', 'validate', 'centroid', 'format', 'write']
+
+
+@contextlib.contextmanager
+def time_stage(timings: Optional[dict], stage_name: str):
+    """Context manager that adds the wall and CPU time spent in the context to the stage's timings
+    Arguments:
+        timings: the dictionary of stage names and their (wall seconds, CPU seconds) tuples; None to not time the stage
+        stage_name: the name of the stage being timed
+    Notes:
+        The CPU time is that of the current thread
+    """
+    if timings is None:
+        yield
+        return
+
+    wall_start = time.perf_counter()
+    cpu_start = time.thread_time()
+    try:
+        yield
+    finally:
+        wall_seconds, cpu_seconds = timings.get(stage_name, (0.0, 0.0))
+        timings[stage_name] = (wall_seconds + time.perf_counter() - wall_start, cpu_seconds + time.thread_time() - cpu_start)
+
+
+def summarize_timings(file_timings: list) -> dict:
+    """Returns the aggregate statistics of the stage timings of the processed files
+    Arguments:
+        file_timings: the list of (file name, timings) tuples where timings are as recorded by time_stage()
+    Return:
+        Returns a dictionary keyed by stage name, with 'wall' and 'cpu' dictionaries containing the 'total', 'mean',
+        'p50', 'p95', and 'max' number of seconds for each stage
+    """
+    summary = {}
+    for stage_name in TIMING_STAGE_NAMES:
+        stage_times = np.array([timings.get(stage_name, (0.0, 0.0)) for _, timings in file_timings], dtype=np.float64)
+        if not stage_times.size:
+            continue
+        summary[stage_name] = {}
+        for time_idx, time_name in enumerate(['wall', 'cpu']):
+            seconds = stage_times[:, time_idx]
+            summary[stage_name][time_name] = {
+                'total': round(float(np.sum(seconds)), 6),
+                'mean': round(float(np.mean(seconds)), 6),
+                'p50': round(float(np.percentile(seconds, 50)), 6),
+                'p95': round(float(np.percentile(seconds, 95)), 6),
+                'max': round(float(np.max(seconds)), 6)
+            }
+
+    return summary
+
+
+def write_timings_file(filename: str, file_timings: list) -> None:
+    """Writes the stage timings of each processed file to a CSV file
+    Arguments:
+        filename: the path of the file to write, an existing file is overwritten
+        file_timings: the list of (file name, timings) tuples where timings are as recorded by time_stage()
+    """
+    header = ['file'] + [stage_name + '_wall' for stage_name in TIMING_STAGE_NAMES] + \
+             [stage_name + '_cpu' for stage_name in TIMING_STAGE_NAMES]
+    with open(filename, 'w', encoding='utf-8', newline='') as out_file:
+        # File names containing commas or quotes are quoted
+        writer = csv.writer(out_file, lineterminator='\n')
+        writer.writerow(header)
+        for one_file, timings in file_timings:
+            writer.writerow([one_file] +
+                            ['%.6f' % timings.get(stage_name, (0.0, 0.0))[0] for stage_name in TIMING_STAGE_NAMES] +
+                            ['%.6f' % timings.get(stage_name, (0.0, 0.0))[1] for stage_name in TIMING_STAGE_NAMES])
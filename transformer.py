@@ -2,32 +2,32 @@
 """Base of plot-level RGB transformer
 """
 import argparse
+import csv
 import datetime
 import logging
-import math
-import numbers
 import os
-import random
-import time
+import signal
 from typing import Optional, Union
-import osgeo
-import numpy as np
 from agpypeline import algorithm, entrypoint
 from agpypeline.environment import Environment
 from agpypeline.checkmd import CheckMD
-from osgeo import gdal, ogr, osr
 
 import algorithm_rgb
+import algorithm_descriptor
+import csv_output
+import image_io
+import image_processing
+import orthomosaic
+import plots
+import results_cache
+import spool_daemon
+import stage_timing
 from configuration import ConfigurationRgbBase
 
+
 # Known image file extensions
 KNOWN_IMAGE_FILE_EXTS = ['.tif', '.tiff', '.jpg']
 
-# Number of tries to open a CSV file before we give up
-MAX_CSV_FILE_OPEN_TRIES = 10
-
-# Maximum number of seconds a single wait for file open can take
-MAX_FILE_OPEN_SLEEP_SEC = 30
 
 # Array of trait names that should have array values associated with them
 TRAIT_NAME_ARRAY_VALUE = ['canopy_cover', 'site']
@@ -50,11 +50,6 @@ GEO_TRAIT_NAMES = ['site', 'trait', 'lat', 'lon', 'dp_time', 'source', 'value',
 BETYDB_TRAIT_NAMES = ['local_datetime', 'access_level', 'species', 'site', 'citation_author', 'citation_year', 'citation_title',
                       'method']
 
-# Used to generate random numbers
-RANDOM_GENERATOR = None
-
-# The LAT-LON EPSG code to use
-LAT_LON_EPSG_CODE = 4326
 
 # Names of files generated
 FILE_NAME_CSV = "rgb_plot.csv"
@@ -73,79 +68,6 @@ class __internal__:
         """Perform class level initialization
         """
 
-    @staticmethod
-    def get_algorithm_definition_bool(variable_name: str, default_value: bool = False) -> bool:
-        """Returns the value of the algorithm definition as a boolean value
-        Arguments:
-            variable_name: the name of the variable to look up
-            default_value: the default value to return if the variable is not defined or is None
-        """
-        value = False
-        if hasattr(algorithm_rgb, variable_name):
-            temp_name = getattr(algorithm_rgb, variable_name)
-            if temp_name:
-                value = True
-            elif temp_name is not None:
-                value = False
-
-        return value if value else default_value
-
-    @staticmethod
-    def get_algorithm_definition_str(variable_name: str, default_value: str = '') -> str:
-        """Returns the value of the string variable found in algorithm_rgb
-        Arguments:
-            variable_name: the name of the definition to find
-            default_value: the default value to return if the variable isn't defined, is not a string, or has an empty value
-        Notes:
-            If the variable can't be determined, the default value is returned
-        """
-        value = None
-        if hasattr(algorithm_rgb, variable_name):
-            temp_name = getattr(algorithm_rgb, variable_name)
-            if isinstance(temp_name, str):
-                value = temp_name.strip()
-
-        return value if value else default_value
-
-    @staticmethod
-    def get_algorithm_name() -> str:
-        """Convenience function for returning the name of the algorithm
-        """
-        return __internal__.get_algorithm_definition_str('ALGORITHM_NAME', 'unknown algorithm')
-
-    @staticmethod
-    def get_algorithm_variable_list(definition_name: str) -> list:
-        """Returns a list containing the variable information defined by the algorithm
-        Arguments:
-            definition_name: name of the variable definition to look up
-        Return:
-            A list of variable strings
-        Note:
-            Assumes that multiple variable-related strings are comma separated
-        """
-        if not hasattr(algorithm_rgb, definition_name):
-            raise RuntimeError("Unable to find %s defined in algorithm_rgb code" % definition_name)
-
-        names = getattr(algorithm_rgb, definition_name).strip()
-        if not names:
-            raise RuntimeError("Empty %s definition specified in algorithm_rgb code" % definition_name)
-
-        return names.split(',')
-
-    @staticmethod
-    def get_algorithm_variable_labels() -> list:
-        """Returns a list containing all the variable names defined by the algorithm
-        Return:
-            A list of variable names
-        """
-        return_labels = []
-        if hasattr(algorithm_rgb, 'VARIABLE_LABELS'):
-            labels = getattr(algorithm_rgb, 'VARIABLE_LABELS').strip()
-            if labels:
-                return_labels = labels.split(',')
-
-        return return_labels
-
     @staticmethod
     def recursive_metadata_search(metadata_list: list, search_key: str, special_key: str = None) -> str:
         """Performs a depth-first search for the key in the metadata and returns the found value
@@ -200,131 +122,15 @@ class __internal__:
         Return:
             Returns a tuple with the name of the algorithm and a dictionary with information on the algorithm
         """
-        return (__internal__.get_algorithm_definition_str('ALGORITHM_NAME', 'unknown'),
+        descriptor = algorithm_descriptor.get_algorithm_descriptor()
+        return (descriptor.metadata_name,
                 {
-                    'version': __internal__.get_algorithm_definition_str('VERSION', 'x.y'),
-                    'traits': __internal__.get_algorithm_definition_str('VARIABLE_NAMES', ''),
-                    'units': __internal__.get_algorithm_definition_str('VARIABLE_UNITS', ''),
-                    'labels': __internal__.get_algorithm_definition_str('VARIABLE_LABELS', '')
+                    'version': descriptor.version,
+                    'traits': ','.join(descriptor.variable_names),
+                    'units': ','.join(descriptor.variable_units),
+                    'labels': ','.join(descriptor.variable_labels)
                 })
 
-    @staticmethod
-    def image_get_geobounds(filename: str) -> list:
-        """Uses gdal functionality to retrieve rectilinear boundaries from the file
-
-        Args:
-            filename: path of the file to get the boundaries from
-
-        Returns:
-            The upper-left and calculated lower-right boundaries of the image in a list upon success.
-            The values are returned in following order: min_y, max_y, min_x, max_x. A list of numpy.nan
-            is returned if the boundaries can't be determined
-        """
-        try:
-            src = gdal.Open(filename)
-            ulx, xres, _, uly, _, yres = src.GetGeoTransform()
-            lrx = ulx + (src.RasterXSize * xres)
-            lry = uly + (src.RasterYSize * yres)
-
-            min_y = min(uly, lry)
-            max_y = max(uly, lry)
-            min_x = min(ulx, lrx)
-            max_x = max(ulx, lrx)
-
-            return [min_y, max_y, min_x, max_x]
-        except Exception as ex:
-            logging.warning("[image_get_geobounds] Exception caught processing file: %s", filename)
-            logging.warning("[image_get_geobounds] Exception: %s", str(ex))
-
-        return [np.nan, np.nan, np.nan, np.nan]
-
-    @staticmethod
-    def get_epsg(filename: str) -> Optional[str]:
-        """Returns the EPSG of the geo-referenced image file
-        Args:
-            filename(str): path of the file to retrieve the EPSG code from
-        Return:
-            Returns the found EPSG code, or None if it's not found or an error ocurred
-        """
-        try:
-            src = gdal.Open(filename)
-
-            proj = osr.SpatialReference(wkt=src.GetProjection())
-
-            return proj.GetAttrValue('AUTHORITY', 1)
-        except Exception as ex:
-            logging.warning("[get_epsg] Exception caught processing file: %s", filename)
-            logging.warning("[get_epsg] Exception: %s", str(ex))
-
-        return None
-
-    @staticmethod
-    def get_centroid_latlon(filename: str) -> Optional[ogr.Geometry]:
-        """Returns the centroid of the geo-referenced image file as an OGR point
-        Arguments:
-            filename: the path to the file to get the centroid from
-        Returns:
-            Returns the centroid of the geometry loaded from the file in lat-lon coordinates
-        Exceptions:
-            RuntimeError is raised if the image is not a geo referenced image with an EPSG code,
-            the EPSG code is not supported, or another problems occurs
-        """
-        bounds = __internal__.image_get_geobounds(filename)
-        if bounds[0] == np.nan:
-            msg = "File is not a geo-referenced image file: %s" % filename
-            logging.info(msg)
-            return None
-
-        epsg = __internal__.get_epsg(filename)
-        if epsg is None:
-            msg = "EPSG is not found in image file: '%s'" % filename
-            logging.info(msg)
-            return None
-
-        ring = ogr.Geometry(ogr.wkbLinearRing)
-        ring.AddPoint(bounds[2], bounds[1])  # Upper left
-        ring.AddPoint(bounds[3], bounds[1])  # Upper right
-        ring.AddPoint(bounds[3], bounds[0])  # lower right
-        ring.AddPoint(bounds[2], bounds[0])  # lower left
-        ring.AddPoint(bounds[2], bounds[1])  # Closing the polygon
-
-        poly = ogr.Geometry(ogr.wkbPolygon)
-        poly.AddGeometry(ring)
-
-        ref_sys = osr.SpatialReference()
-        if ref_sys.ImportFromEPSG(int(epsg)) == ogr.OGRERR_NONE:
-            poly.AssignSpatialReference(ref_sys)
-        else:
-            msg = "Failed to import EPSG %s for image file %s" % (str(epsg), filename)
-            logging.error(msg)
-            raise RuntimeError(msg)
-        if int(osgeo.__version__[0]) >= 3:
-            # GDAL 3 changes axis order: https://github.com/OSGeo/gdal/issues/1546
-            # pylint: disable=no-member
-            ref_sys.SetAxisMappingStrategy(osgeo.osr.OAMS_TRADITIONAL_GIS_ORDER)
-
-        # Convert the polygon to lat-lon
-        dest_spatial = osr.SpatialReference()
-        if dest_spatial.ImportFromEPSG(int(LAT_LON_EPSG_CODE)) != ogr.OGRERR_NONE:
-            msg = "Failed to import EPSG %s for conversion to lat-lon" % str(LAT_LON_EPSG_CODE)
-            logging.error(msg)
-            raise RuntimeError(msg)
-        if int(osgeo.__version__[0]) >= 3:
-            # GDAL 3 changes axis order: https://github.com/OSGeo/gdal/issues/1546
-            # pylint: disable=no-member
-            dest_spatial.SetAxisMappingStrategy(osgeo.osr.OAMS_TRADITIONAL_GIS_ORDER)
-
-        transform = osr.CoordinateTransformation(ref_sys, dest_spatial)
-        new_src = poly.Clone()
-        if new_src:
-            new_src.Transform(transform)
-        else:
-            msg = "Failed to transform file polygon to lat-lon %s" % filename
-            logging.error(msg)
-            raise RuntimeError(msg)
-
-        return new_src.Centroid()
-
     @staticmethod
     def get_time_stamps(iso_timestamp: str, args: argparse.Namespace) -> list:
         """Returns the date and the local time (offset is stripped) derived from the passed in timestamp
@@ -343,106 +149,6 @@ class __internal__:
 
         return [timestamp.strftime('%Y-%m-%d'), timestamp.strftime('%Y-%m-%dT%H:%M:%S')]
 
-    @staticmethod
-    def get_open_backoff(prev: float = None) -> float:
-        """Returns the number of seconds to back off from opening a file
-        Args:
-            prev(int or float): the previous return value from this function
-        Return:
-            Returns the number of seconds (including fractional seconds) to wait
-        Note that the return value is deterministic, and always the same, when None is
-        passed in
-        """
-        # pylint: disable=global-statement
-        global RANDOM_GENERATOR
-
-        # Simple case
-        if prev is None:
-            return 1
-
-        # Get a random number generator
-        if RANDOM_GENERATOR is None:
-            try:
-                RANDOM_GENERATOR = random.SystemRandom()
-            finally:
-                # Set this so we don't try again
-                RANDOM_GENERATOR = 0
-
-        # Get a random number
-        if RANDOM_GENERATOR:
-            multiplier = RANDOM_GENERATOR.random()  # pylint: disable=no-member
-        else:
-            multiplier = random.random()
-
-        # Calculate how long to sleep
-        sleep = math.trunc(float(prev) * multiplier * 100) / 10.0
-        if sleep > MAX_FILE_OPEN_SLEEP_SEC:
-            sleep = max(0.1, math.trunc(multiplier * 100) / 10)
-
-        return sleep
-
-    @staticmethod
-    def write_csv_file(filename: str, header: str, data: str) -> bool:
-        """Attempts to write out the data to the specified file. Will write the
-           header information if it's the first call to write to the file.
-           If the file is not available, it waits as configured until it becomes
-           available, or returns an error.
-           Args:
-                filename: path to the file to write to
-                header: Optional CSV formatted header to write to the file; can be set to None
-                data: CSV formatted data to write to the file
-            Return:
-                Returns True if the file was written to and False otherwise
-        """
-        if not filename or not data:
-            logging.error("Empty parameter passed to write_geo_csv")
-            return False
-
-        csv_file = None
-        backoff_secs = None
-        for tries in range(0, MAX_CSV_FILE_OPEN_TRIES):
-            try:
-                # pylint: disable=consider-using-with
-                csv_file = open(filename, 'a+', encoding='utf-8')
-            except Exception as ex:
-                # Ignore an exception here since we handle it below
-                logging.debug("Exception caught while trying to open CSV file: %s", filename)
-                logging.debug("Exception: %s", str(ex))
-
-            if csv_file:
-                break
-
-            # If we can't open the file, back off and try again (unless it's our last try)
-            if tries < MAX_CSV_FILE_OPEN_TRIES - 1:
-                backoff_secs = __internal__.get_open_backoff(backoff_secs)
-                logging.info("Sleeping for %s seconds before trying to open CSV file again", str(backoff_secs))
-                time.sleep(backoff_secs)
-
-        if not csv_file:
-            logging.error("Unable to open CSV file for writing: '%s'", filename)
-            return False
-
-        wrote_file = False
-        try:
-            # Check if we need to write a header
-            if os.fstat(csv_file.fileno()).st_size <= 0:
-                csv_file.write(header + "\n")
-
-            # Write out data
-            csv_file.write(data + "\n")
-
-            wrote_file = True
-        except Exception as ex:
-            logging.error("Exception while writing CSV file: '%s'", filename)
-            logging.error("Exception: %s", str(ex))
-            # Re-raise the exception
-            raise ex from None
-        finally:
-            csv_file.close()
-
-        # Return whether or not we wrote to the file
-        return wrote_file
-
     @staticmethod
     def get_csv_fields(variable_names: list) -> list:
         """Returns the list of CSV field names as a list
@@ -486,34 +192,7 @@ class __internal__:
         Return:
              A list of strings that can be used as the header to a CSV file
         """
-        header_fields = []
-        variable_names = __internal__.get_algorithm_variable_list('VARIABLE_NAMES')
-        variable_units = __internal__.get_algorithm_variable_list('VARIABLE_UNITS')
-        variable_units_len = len(variable_units)
-        variable_labels = __internal__.get_algorithm_variable_labels()
-        variable_labels_len = len(variable_labels)
-
-        if variable_units_len != len(variable_names):
-            logging.warning("The number of variable units doesn't match the number of variable names")
-            logging.warning("Continuing with defined variable units")
-        if variable_labels_len and variable_labels_len != len(variable_names):
-            logging.warning("The number of variable labels doesn't match the number of variable names")
-            logging.warning("Continuing with defined variable labels")
-
-        logging.debug("Variable names: %s", str(variable_names))
-        logging.debug("Variable labels: %s", str(variable_labels))
-        logging.debug("Variable units: %s", str(variable_units))
-
-        for idx, field_name in enumerate(variable_names):
-            field_header = field_name
-            if idx < variable_labels_len:
-                field_header += ' %s' % variable_labels[idx]
-            if idx < variable_units_len:
-                field_header += ' (%s)' % variable_units[idx]
-            header_fields.append(field_header)
-
-        logging.debug("Header fields: %s", str(CSV_TRAIT_NAMES + header_fields))
-        return CSV_TRAIT_NAMES + header_fields
+        return CSV_TRAIT_NAMES + list(algorithm_descriptor.get_algorithm_descriptor().variable_header_fields)
 
     @staticmethod
     def get_csv_traits_table(variable_names: list) -> tuple:
@@ -529,12 +208,13 @@ class __internal__:
         for field_name in fields:
             traits[field_name] = __internal__.get_default_trait(field_name)
 
-        if hasattr(algorithm_rgb, 'CITATION_AUTHOR') and getattr(algorithm_rgb, 'CITATION_AUTHOR'):
-            traits['citation_author'] = '"' + getattr(algorithm_rgb, 'CITATION_AUTHOR') + '"'
-        if hasattr(algorithm_rgb, 'CITATION_TITLE') and getattr(algorithm_rgb, 'CITATION_TITLE'):
-            traits['citation_title'] = '"' + getattr(algorithm_rgb, 'CITATION_TITLE') + '"'
-        if hasattr(algorithm_rgb, 'CITATION_YEAR') and getattr(algorithm_rgb, 'CITATION_YEAR'):
-            traits['citation_year'] = '"' + getattr(algorithm_rgb, 'CITATION_YEAR') + '"'
+        descriptor = algorithm_descriptor.get_algorithm_descriptor()
+        if descriptor.citation_author:
+            traits['citation_author'] = '"' + descriptor.citation_author + '"'
+        if descriptor.citation_title:
+            traits['citation_title'] = '"' + descriptor.citation_title + '"'
+        if descriptor.citation_year:
+            traits['citation_year'] = '"' + descriptor.citation_year + '"'
 
         return fields, traits
 
@@ -565,38 +245,18 @@ class __internal__:
         for field_name in fields:
             traits[field_name] = __internal__.get_default_trait(field_name)
 
-        if hasattr(algorithm_rgb, 'CITATION_AUTHOR') and getattr(algorithm_rgb, 'CITATION_AUTHOR'):
-            traits['citation_author'] = '"' + getattr(algorithm_rgb, 'CITATION_AUTHOR') + '"'
-        if hasattr(algorithm_rgb, 'CITATION_TITLE') and getattr(algorithm_rgb, 'CITATION_TITLE'):
-            traits['citation_title'] = '"' + getattr(algorithm_rgb, 'CITATION_TITLE') + '"'
-        if hasattr(algorithm_rgb, 'CITATION_YEAR') and getattr(algorithm_rgb, 'CITATION_YEAR'):
-            traits['citation_year'] = '"' + getattr(algorithm_rgb, 'CITATION_YEAR') + '"'
-        if hasattr(algorithm_rgb, 'ALGORITHM_METHOD') and getattr(algorithm_rgb, 'ALGORITHM_METHOD'):
-            traits['method'] = '"' + getattr(algorithm_rgb, 'ALGORITHM_METHOD') + '"'
+        descriptor = algorithm_descriptor.get_algorithm_descriptor()
+        if descriptor.citation_author:
+            traits['citation_author'] = '"' + descriptor.citation_author + '"'
+        if descriptor.citation_title:
+            traits['citation_title'] = '"' + descriptor.citation_title + '"'
+        if descriptor.citation_year:
+            traits['citation_year'] = '"' + descriptor.citation_year + '"'
+        if descriptor.method:
+            traits['method'] = '"' + descriptor.method + '"'
 
         return fields, traits
 
-    @staticmethod
-    def generate_traits_list(fields: list, traits: dict) -> list:
-        """Returns an array of trait values
-        Args:
-            fields: the list of fields to look up and return
-            traits: contains the set of trait values to return
-        Return:
-            Returns an array of trait values taken from the traits parameter
-        Notes:
-            If a trait isn't found, it's assigned an empty string
-        """
-        # compose the summary traits
-        trait_list = []
-        for field_name in fields:
-            if field_name in traits:
-                trait_list.append(traits[field_name])
-            else:
-                trait_list.append(__internal__.get_default_trait(field_name))
-
-        return trait_list
-
     @staticmethod
     def filter_file_list_by_ext(source_files: list, known_exts: list) -> list:
         """Returns the list of known files by extension
@@ -652,62 +312,119 @@ class __internal__:
                 os.path.join(csv_path, FILE_NAME_BETYDB_CSV)]
 
     @staticmethod
-    def validate_calc_value(calc_value, variable_names: list) -> list:
-        """Returns a list of the validated value(s) as compared against type and length of variable names
+    def load_csv_keys(filename: str, key_fields: list) -> Optional[set]:
+        """Loads the set of keys of the rows in an existing CSV file
         Arguments:
-            calc_value: the calculated value(s) to validate (int, float, str, dict, list, etc.)
-            variable_names: the list of the names of expected variables
+            filename: the path of the CSV file to load
+            key_fields: the names of the fields that make up a row's key
         Return:
-            Returns the validated values as a list
-        Exceptions:
-            RuntimeError is raised if the calc_value is not a supported type or the number of values doesn't match
-            the expected number (as determined by variable_names)
+            Returns the set of key tuples found in the file, or None if the file doesn't exist or doesn't have all the key fields
+        Notes:
+            The file is read one row at a time so that only the keys are kept in memory
         """
-        if isinstance(calc_value, set):
-            raise RuntimeError("A 'set' type of data was returned and isn't supported. Please use a list or a tuple instead")
+        if not os.path.exists(filename):
+            return None
 
-        # Special case handling for special return dict (values and other stuff)
-        if isinstance(calc_value, dict) and 'values' in calc_value:
-            values_result = calc_value['values']
-        else:
-            values_result = calc_value
-
-        # Get the values into list form
-        values = []
-        len_variable_names = len(variable_names)
-        if isinstance(values_result, dict):
-            # Assume the dictionary is going to have field names with their values
-            # We check whether we have the correct number of fields later. This also
-            # filters out extra fields
-            values = []
-            for key in variable_names:
-                if key in values_result:
-                    values.append(values_result[key])
-        elif not isinstance(values_result, (list, tuple)):
-            values = [values_result]
-        else:
-            values = values_result
+        keys = set()
+        with open(filename, 'r', encoding='utf-8', newline='') as in_file:
+            reader = csv.reader(in_file)
+            header = next(reader, None)
+            if not header:
+                return keys
+            if not all(one_field in header for one_field in key_fields):
+                logging.warning("Unable to find key fields %s in CSV file: '%s'", str(key_fields), filename)
+                return None
+            key_indexes = [header.index(one_field) for one_field in key_fields]
+            max_index = max(key_indexes)
+            for row in reader:
+                if len(row) > max_index:
+                    keys.add(tuple(row[idx] for idx in key_indexes))
+
+        return keys
 
-        # Sanity check our values
-        len_calc_value = len(values)
-        if not len_calc_value == len_variable_names:
-            raise RuntimeError("Incorrect number of values returned. Expected " + str(len_variable_names) +
-                               " and received " + str(len_calc_value))
+    @staticmethod
+    def filter_completed_files(image_files: list, datestamp: str, csv_file: str, geostreams_csv_file: str) -> list:
+        """Returns the list of image files that don't have results in the existing CSV files
+        Arguments:
+            image_files: the list of image files to check
+            datestamp: the timestamp written to the CSV files for the images
+            csv_file: the path to the default CSV file
+            geostreams_csv_file: the path to the Geostreams CSV file
+        Return:
+            Returns the list of image files without existing results
+        Notes:
+            An image has results in the default CSV file when a row has its site and timestamp, and in the Geostreams
+            CSV file when a row has its site, timestamp, and source file. An image needs to have results in both files
+            to be considered complete. The Geostreams CSV file is required since it's the only file that records the
+            source file, and a plot can have more than one image. If a file doesn't exist, no images are complete
+        """
+        csv_keys = __internal__.load_csv_keys(csv_file, ['site', 'timestamp'])
+        if not csv_keys:
+            return image_files
+        geo_keys = __internal__.load_csv_keys(geostreams_csv_file, ['site', 'timestamp', 'source'])
+        if not geo_keys:
+            return image_files
+
+        remaining_files = []
+        for one_file in image_files:
+            plot_name = plots.get_plot_name(one_file)
+            if (plot_name, datestamp) in csv_keys and (plot_name, datestamp, one_file) in geo_keys:
+                logging.debug("Skipping image with existing results: '%s'", one_file)
+                continue
+            remaining_files.append(one_file)
 
-        return values
+        return remaining_files
 
     @staticmethod
-    def write_trait_csv(filename: str, header: str, fields: list, traits: dict) -> None:
-        """Writes the trait data to the specified CSV file
+    def get_plot_species_index(full_md: list) -> dict:
+        """Builds an index of plot names to species for finding a plot's species
         Arguments:
-            filename: the name of the file to write to
-            header: the file header to be written as needed
-            fields: the list of field names to save to the file
-            traits: the trait values to write
+            full_md: the full list of metadata
+        Return:
+            Returns a dictionary containing the 'exact' plot name to species mapping, the 'lower' case plot name to species
+            mapping, and the 'default' species to use when a plot isn't found (None if a default wasn't found)
+        Notes:
+            The index follows the same precedence as a search of the metadata: the first exact match of a plot name is kept,
+            the last case-insensitive match is kept, and the last species found at the top level of the metadata is the default
         """
-        trait_list = __internal__.generate_traits_list(fields, traits)
-        csv_data = ','.join(map(str, trait_list))
-        __internal__.write_csv_file(filename, header, csv_data)
+        exact = {}
+        lower = {}
+        default = None
+
+        for one_md in full_md:
+            if 'species' in one_md:
+                default = one_md['species']
+            if 'plots' in one_md:
+                for one_plot in one_md['plots']:
+                    if 'name' in one_plot and 'species' in one_plot:
+                        plot_name = str(one_plot['name'])
+                        if plot_name not in exact:
+                            exact[plot_name] = one_plot['species']
+                        lower[plot_name.lower()] = one_plot['species']
+
+        return {'exact': exact, 'lower': lower, 'default': default}
+
+    @staticmethod
+    def find_plot_species(plot_name: str, species_index: dict) -> str:
+        """Returns the species of the plot using a plot species index
+        Arguments:
+            plot_name: the name of the plot to find the species of
+            species_index: the index returned by get_plot_species_index()
+        Returns:
+            Returns the found species or "" (empty string) if the plot was not found
+        Notes:
+            If not found, the return value will be one of the following (in priority order): the case-insensitive
+            plot name match, the species found in the metadata, ""
+        """
+        if plot_name in species_index['exact']:
+            return species_index['exact'][plot_name]
+
+        # Exact matches are all found above, so any match here is only case-insensitive
+        lower_name = plot_name.lower()
+        if lower_name in species_index['lower']:
+            return species_index['lower'][lower_name]
+
+        return species_index['default'] if species_index['default'] is not None else ''
 
     @staticmethod
     def get_plot_species(plot_name: str, full_md: list) -> str:
@@ -720,32 +437,9 @@ class __internal__:
         Notes:
             Returns the first match found. If not found, the return value will be one of the following (in
             priority order): the case-insensitive plot name match, the command line species argument, ""
+            When looking up multiple plots, use get_plot_species_index() and find_plot_species() instead
         """
-        possible = None
-        optional = None
-
-        # Disable pylint nested block depth check to avoid 2*N looping (save lower case possibility vs. 2 loops
-        # with one check in each)
-        # pylint: disable=too-many-nested-blocks
-        for one_md in full_md:
-            if 'species' in one_md:
-                optional = one_md['species']
-            if 'plots' in one_md:
-                for one_plot in one_md['plots']:
-                    # Try to find the plot name in 'plots' in a case sensitive way, followed by case insensitive
-                    if 'name' in one_plot:
-                        if str(one_plot['name']) == plot_name:
-                            if 'species' in one_plot:
-                                return one_plot['species']
-                        elif str(one_plot['name']).lower() == plot_name.lower():
-                            if 'species' in one_plot:
-                                possible = one_plot['species']
-
-        # Check if we found a possibility, but not an exact match
-        if possible is not None:
-            return possible
-
-        return optional if optional is not None else ''
+        return __internal__.find_plot_species(plot_name, __internal__.get_plot_species_index(full_md))
 
 
 class RgbPlotBase(algorithm.Algorithm):
@@ -756,25 +450,58 @@ class RgbPlotBase(algorithm.Algorithm):
         Arguments:
             parser: instance of argparse
         """
+        descriptor = algorithm_descriptor.get_algorithm_descriptor()
         supported_files = [FILE_NAME_CSV + ': basic CSV file with calculated values']
-        if __internal__.get_algorithm_definition_bool('WRITE_GEOSTREAMS_CSV', False):
+        if descriptor.write_geostreams_csv:
             supported_files.append(FILE_NAME_BETYDB_CSV + ': TERRA REF Geostreams compatible CSV file')
-        if __internal__.get_algorithm_definition_bool('WRITE_BETYDB_CSV', False):
+        if descriptor.write_betydb_csv:
             supported_files.append(FILE_NAME_BETYDB_CSV + ': BETYdb compatible CSV file')
 
-        parser.description = 'Plot level RGB algorithm: ' + __internal__.get_algorithm_name() + \
-                             ' version ' + __internal__.get_algorithm_definition_str('VERSION', 'x.y')
+        parser.description = 'Plot level RGB algorithm: ' + descriptor.name + ' version ' + descriptor.version
 
         parser.add_argument('--csv_path', help='the path to use when generating the CSV files')
         parser.add_argument('--timestamp', help='the timestamp to use in ISO 8601 format (eg:YYYY-MM-DDTHH:MM:SS')
         parser.add_argument('--geostreams_csv', action='store_true',
                             help='override to always create the TERRA REF Geostreams-compatible CSV file')
         parser.add_argument('--betydb_csv', action='store_true', help='override to always create the BETYdb-compatible CSV file')
+        parser.add_argument('--csv_flush_rows', type=int, default=csv_output.CSV_FLUSH_MAX_ROWS,
+                            help='the number of rows to buffer for each CSV file before writing them; 0 to ' +
+                            'only limit the number of bytes (default: %(default)s)')
+        parser.add_argument('--csv_flush_bytes', type=int, default=csv_output.CSV_FLUSH_MAX_BYTES,
+                            help='the number of bytes of rows to buffer for each CSV file before writing them; 0 to ' +
+                            'only limit the number of rows; when both are 0 the rows are written when processing is ' +
+                            'complete (default: %(default)s)')
+        parser.add_argument('--workers', type=int, default=1,
+                            help='the number of processes to use when processing images (default: %(default)s)')
+        parser.add_argument('--prefetch', type=int, default=0,
+                            help='the number of images to load ahead on other threads while the algorithm runs; ' +
+                            'only used when processing images in a single process (default: %(default)s)')
+        parser.add_argument('--calculate_batch_size', type=int, default=image_processing.CALCULATE_BATCH_SIZE,
+                            help='the maximum number of images passed in one call to algorithms that define ' +
+                            'calculate_batch() (default: %(default)s)')
+        parser.add_argument('--resume', action='store_true',
+                            help='skip images that already have results in the CSV files found in the csv path; ' +
+                            'requires the Geostreams CSV file to be written')
+        parser.add_argument('--cache_path',
+                            help='the path of a results cache file; images with cached results are not processed again')
+        parser.add_argument('--cache_max_mb', type=float, default=results_cache.RESULT_CACHE_MAX_BYTES / (1024 * 1024),
+                            help='the maximum size of the results cache in megabytes (default: %(default)s)')
+        parser.add_argument('--cache_hash', action='store_true',
+                            help='include a hash of the start and end of each image file in the results cache key')
+        parser.add_argument('--plot_clip', action='store_true',
+                            help='treat the images as orthomosaics and clip the plots from them using the plot geometries ' +
+                            'found in the metadata')
+        parser.add_argument('--plot_footprint', action='store_true',
+                            help="name each image's plot using the plot geometry in the metadata that overlaps the image " +
+                            'the most, instead of the name of the folder containing the image')
+        parser.add_argument('--timing', action='store_true',
+                            help='record the time spent in each processing stage and return the statistics in the metadata')
+        parser.add_argument('--timing_file', help='the path of a CSV file to write the stage timings of each image to; ' +
+                            'implies --timing')
 
         parser.epilog = 'The following files are created in the specified csv path by default: ' + \
                         '\n  ' + '\n  '.join(supported_files) + '\n' + \
-                        ' author ' + __internal__.get_algorithm_definition_str('ALGORITHM_AUTHOR', 'mystery author') + \
-                        ' ' + __internal__.get_algorithm_definition_str('ALGORITHM_AUTHOR_EMAIL', '(no email)')
+                        ' author ' + descriptor.author + ' ' + descriptor.author_email
 
     def check_continue(self, environment: Environment, check_md: CheckMD, transformer_md: dict, full_md: list) -> tuple:
         """Checks if conditions are right for continuing processing
@@ -816,15 +543,17 @@ class RgbPlotBase(algorithm.Algorithm):
         # pylint: disable=too-many-statements, too-many-locals, too-many-branches
 
         # Environment checking
-        if not hasattr(algorithm_rgb, 'calculate'):
-            msg = "The 'calculate()' function was not found in algorithm_rgb.py"
+        if not hasattr(algorithm_rgb, 'calculate') and not algorithm_descriptor.algorithm_supports_chunks():
+            msg = "The 'calculate()' function, or the 'calculate_map()' and 'calculate_combine()' functions, " + \
+                  "were not found in algorithm_rgb.py"
             logging.error(msg)
             return {'code': -1001, 'error': msg}
 
         logging.debug("Working with check_md: %s", str(check_md))
 
         # Setup local variables
-        variable_names = __internal__.get_algorithm_variable_list('VARIABLE_NAMES')
+        descriptor = algorithm_descriptor.get_algorithm_descriptor()
+        variable_names = list(descriptor.variable_names)
 
         csv_file, geostreams_csv_file, betydb_csv_file = __internal__.get_csv_file_names(
             __internal__.determine_csv_path([environment.args.csv_path, check_md.working_folder]))
@@ -833,9 +562,34 @@ class RgbPlotBase(algorithm.Algorithm):
         logging.debug("Calculated BETYdb CSV path: %s", betydb_csv_file)
         datestamp, localtime = __internal__.get_time_stamps(check_md.timestamp, environment.args)
 
-        write_geostreams_csv = environment.args.geostreams_csv or __internal__.get_algorithm_definition_bool('WRITE_GEOSTREAMS_CSV', False)
-        write_betydb_csv = environment.args.betydb_csv or __internal__.get_algorithm_definition_bool('WRITE_BETYDB_CSV', False)
+        num_workers = environment.args.workers if 'workers' in environment.args and environment.args.workers else 1
+        logging.info("Number of image processing workers: %s", str(num_workers))
+        prefetch = environment.args.prefetch if 'prefetch' in environment.args and environment.args.prefetch else 0
+        if prefetch and num_workers < 2:
+            logging.info("Number of images to load ahead: %s", str(prefetch))
+        calculate_batch_size = environment.args.calculate_batch_size if 'calculate_batch_size' in environment.args \
+            else image_processing.CALCULATE_BATCH_SIZE
+        if calculate_batch_size > 1 and algorithm_descriptor.algorithm_supports_batches():
+            logging.info("Number of images in each algorithm call: %s", str(calculate_batch_size))
+        timing_file = environment.args.timing_file if 'timing_file' in environment.args else None
+        timing = bool(timing_file) or ('timing' in environment.args and environment.args.timing)
+        plot_clip = 'plot_clip' in environment.args and environment.args.plot_clip
+        plot_footprint = not plot_clip and 'plot_footprint' in environment.args and environment.args.plot_footprint
+        if plot_clip and ('resume' in environment.args and environment.args.resume or
+                          'cache_path' in environment.args and environment.args.cache_path):
+            logging.warning("Resuming and the results cache are not used when clipping plots from orthomosaics")
+        if plot_footprint and 'resume' in environment.args and environment.args.resume:
+            logging.warning("Resuming is not used when finding plots by image footprint")
+
+        write_geostreams_csv = environment.args.geostreams_csv or descriptor.write_geostreams_csv
+        write_betydb_csv = environment.args.betydb_csv or descriptor.write_betydb_csv
         logging.info("Writing geostreams csv file: %s", "True" if write_geostreams_csv else "False")
+        resume = not plot_clip and not plot_footprint and 'resume' in environment.args and environment.args.resume
+        if resume and not write_geostreams_csv:
+            msg = "Resuming requires the Geostreams CSV file, which records the source image of each result; " + \
+                  "specify --geostreams_csv to write it"
+            logging.error(msg)
+            return {'code': -1002, 'error': msg}
         logging.info("Writing BETYdb csv file: %s", "True" if write_betydb_csv else "False")
 
         # Get default values and adjust as needed
@@ -847,90 +601,120 @@ class RgbPlotBase(algorithm.Algorithm):
         geo_csv_header = ','.join(map(str, geo_fields))
         bety_csv_header = ','.join(map(str, bety_fields))
 
-        # Process the image files
-        num_image_files = 0
-        entries_written = 0
-        additional_files_list = []
-        significant_digits_format = '.' + str(SIGNIFICANT_DIGITS) + 'g'
-        for one_file in __internal__.filter_file_list_by_ext(check_md.get_list_files(), KNOWN_IMAGE_FILE_EXTS):
-
-            plot_name = None
+        # Rows are buffered and written in bulk
+        csv_flush_rows = environment.args.csv_flush_rows if 'csv_flush_rows' in environment.args else \
+            csv_output.CSV_FLUSH_MAX_ROWS
+        csv_flush_bytes = environment.args.csv_flush_bytes if 'csv_flush_bytes' in environment.args else \
+            csv_output.CSV_FLUSH_MAX_BYTES
+        csv_writer = csv_output.CsvFileWriter(csv_file, csv_header, csv_flush_rows, csv_flush_bytes)
+        geo_csv_writer = csv_output.CsvFileWriter(geostreams_csv_file, geo_csv_header, csv_flush_rows, csv_flush_bytes)
+        bety_csv_writer = csv_output.CsvFileWriter(betydb_csv_file, bety_csv_header, csv_flush_rows, csv_flush_bytes)
+
+        # Open the results cache
+        result_cache = None
+        if not plot_clip and 'cache_path' in environment.args and environment.args.cache_path:
             try:
-                num_image_files += 1
-
-                # Setup
-                plot_name = os.path.basename(os.path.dirname(one_file))
-                centroid = __internal__.get_centroid_latlon(one_file)
-                image_pix = np.rollaxis(np.array(gdal.Open(one_file).ReadAsArray()), 0, 3)
+                result_cache = results_cache.ResultCache(environment.args.cache_path, variable_names,
+                                                         int(environment.args.cache_max_mb * 1024 * 1024),
+                                                         environment.args.cache_hash)
+            except Exception as ex:
+                logging.error("Unable to open results cache '%s', continuing without the cache", environment.args.cache_path)
+                logging.error("Exception: %s", str(ex))
 
-                # Make the call and check the results
-                calc_value = algorithm_rgb.calculate(image_pix)
-                logging.debug("Calculated value is %s for file: %s", str(calc_value), one_file)
-                if calc_value is None:
-                    continue
+        # Index the plot species and boundaries
+        species_index = __internal__.get_plot_species_index(full_md)
+        plot_index = None
+        if plot_clip or plot_footprint:
+            plot_index = plots.PlotIndex(plots.get_plot_boundaries(full_md))
+            logging.info("Indexed %s plot boundaries", str(len(plot_index.plots)))
 
-                if isinstance(calc_value, dict) and 'file' in calc_value and calc_value['file']:
-                    additional_files_list.extend(calc_value['file'])
-
-                values = __internal__.validate_calc_value(calc_value, variable_names)
-                logging.debug("Verified values are %s", str(values))
-
-                geo_traits['site'] = plot_name
-                geo_traits['dp_time'] = localtime
-                geo_traits['source'] = one_file
-                geo_traits['timestamp'] = datestamp
-
-                if centroid is not None:
-                    geo_traits['lat'] = str(centroid.GetY())
-                    geo_traits['lon'] = str(centroid.GetX())
-                else:
-                    geo_traits['lat'] = ''
-                    geo_traits['lon'] = ''
-
-                # Write the data points geographically and otherwise
-                for idx, trait_name in enumerate(variable_names):
-                    # Get numbers truncated to significant digits
-                    if isinstance(values[idx], numbers.Number):
-                        value_str = format(values[idx], significant_digits_format)
+        # Process the image files
+        entries_written = 0
+        additional_files_list = []
+        image_files = __internal__.filter_file_list_by_ext(check_md.get_list_files(), KNOWN_IMAGE_FILE_EXTS)
+        num_skipped_files = 0
+        if resume:
+            remaining_files = __internal__.filter_completed_files(image_files, datestamp, csv_file, geostreams_csv_file)
+            num_skipped_files = len(image_files) - len(remaining_files)
+            logging.info("Skipping %s images that already have results", str(num_skipped_files))
+            image_files = remaining_files
+        num_image_files = len(image_files)
+        if plot_clip:
+            results_batches = orthomosaic.iterate_plot_result_batches(image_files, plot_index, variable_names,
+                                                                      num_workers, timing=timing)
+        else:
+            results_batches = image_processing.iterate_result_batches(image_files, variable_names, num_workers, timing=timing,
+                                                                      prefetch=prefetch, result_cache=result_cache,
+                                                                      calculate_batch_size=calculate_batch_size)
+        file_timings = []
+        results_table = csv_output.ResultsTable(variable_names)
+        for results_batch in results_batches:
+
+            # Locate all the images in the batch at once
+            centroid_timings = {} if timing else None
+            with stage_timing.time_stage(centroid_timings, 'centroid'):
+                latitudes, longitudes, geo_errors = image_io.get_centroids_latlon([result['geo'] for _, result in results_batch])
+
+            for result_idx, (one_file, result) in enumerate(results_batch):
+                plot_name = None
+                try:
+                    # Setup
+                    timings = result['timing']
+                    if timings is not None:
+                        # Each image is charged an equal share of locating the batch
+                        wall_seconds, cpu_seconds = centroid_timings['centroid']
+                        timings['centroid'] = (wall_seconds / len(results_batch), cpu_seconds / len(results_batch))
+                        file_timings.append((one_file, timings))
+                    if 'plot' in result:
+                        plot_name = result['plot']
+                    elif plot_footprint:
+                        plot_name = plots.find_footprint_plot_name(one_file, result['geo'], plot_index)
                     else:
-                        value_str = str(values[idx])
-
-                    # Geostreams can only handle one field at a time so we write out one row per field/value pair
-                    geo_traits['trait'] = trait_name
-                    geo_traits['value'] = value_str
-                    if write_geostreams_csv:
-                        __internal__.write_trait_csv(geostreams_csv_file, geo_csv_header, geo_fields, geo_traits)
-
-                    # csv and BETYdb can handle wide rows with multiple values so we just set the field
-                    # values here and write the single row after the loop
-                    csv_traits[variable_names[idx]] = value_str
-                    bety_traits[variable_names[idx]] = value_str
-
-                csv_traits['site'] = plot_name
-                csv_traits['timestamp'] = datestamp
-                csv_traits['species'] = __internal__.get_plot_species(plot_name, full_md)
-                if centroid is not None:
-                    csv_traits['lat'] = str(centroid.GetY())
-                    csv_traits['lon'] = str(centroid.GetX())
-                else:
-                    csv_traits['lat'] = ''
-                    csv_traits['lon'] = ''
-                __internal__.write_trait_csv(csv_file, csv_header, csv_fields, csv_traits)
-
-                bety_traits['site'] = plot_name
-                bety_traits['local_datetime'] = localtime
-                bety_traits['species'] = __internal__.get_plot_species(plot_name, full_md)
-                if write_betydb_csv:
-                    __internal__.write_trait_csv(betydb_csv_file, bety_csv_header, bety_fields, bety_traits)
-
-                entries_written += 1
+                        plot_name = plots.get_plot_name(one_file)
+                    species = __internal__.find_plot_species(plot_name, species_index)
+                    additional_files_list.extend(result['file'])
+                    if result_idx in geo_errors:
+                        raise RuntimeError(geo_errors[result_idx])
+
+                    results_table.add_row(plot_name, species, one_file, latitudes[result_idx], longitudes[result_idx],
+                                          result['values'], timings)
+                    entries_written += 1
+
+                except Exception as ex:
+                    logging.error("Error generating %s for %s", algorithm_descriptor.get_algorithm_name(), str(plot_name))
+                    logging.error("Exception: %s", str(ex))
+                    continue
 
+            # Write the batch's results to the CSV files together
+            try:
+                csv_output.write_results_table(results_table, SIGNIFICANT_DIGITS, datestamp, localtime,
+                                               (csv_writer, csv_fields, csv_traits),
+                                               (geo_csv_writer, geo_fields, geo_traits) if write_geostreams_csv else None,
+                                               (bety_csv_writer, bety_fields, bety_traits) if write_betydb_csv else None)
             except Exception as ex:
-                logging.error("Error generating %s for %s", __internal__.get_algorithm_name(), str(plot_name))
+                logging.error("Exception caught while writing the results of %s images", str(results_table.num_rows))
+                logging.error("Exception: %s", str(ex))
+                entries_written -= results_table.num_rows
+            results_table.clear()
+
+        # Write any remaining rows
+        flush_timings = {} if timing else None
+        with stage_timing.time_stage(flush_timings, 'write'):
+            for one_writer in (csv_writer, geo_csv_writer, bety_csv_writer):
+                try:
+                    one_writer.flush()
+                except Exception as ex:
+                    logging.error("Exception caught while writing CSV file: '%s'", one_writer.filename)
+                    logging.error("Exception: %s", str(ex))
+
+        if result_cache is not None:
+            try:
+                result_cache.close()
+            except Exception as ex:
+                logging.error("Exception caught while closing results cache: '%s'", result_cache.path)
                 logging.error("Exception: %s", str(ex))
-                continue
 
-        if num_image_files == 0:
+        if num_image_files == 0 and num_skipped_files == 0:
             logging.warning("No images were detected for processing")
         if entries_written == 0:
             logging.warning("No entries were written to CSV files")
@@ -939,10 +723,26 @@ class RgbPlotBase(algorithm.Algorithm):
         algorithm_name, algorithm_md = __internal__.prepare_algorithm_metadata()
         algorithm_md['files_processed'] = str(num_image_files)
         algorithm_md['lines_written'] = str(entries_written)
+        if num_skipped_files:
+            algorithm_md['files_skipped'] = str(num_skipped_files)
         if write_geostreams_csv:
             algorithm_md['wrote_geostreams'] = "Yes"
         if write_betydb_csv:
             algorithm_md['wrote_betydb'] = "Yes"
+        if result_cache is not None:
+            algorithm_md['cache_hits'] = str(result_cache.hits)
+            algorithm_md['cache_misses'] = str(result_cache.misses)
+        if timing:
+            algorithm_md['timing'] = stage_timing.summarize_timings(file_timings)
+            algorithm_md['timing']['final_write'] = {'wall': round(flush_timings['write'][0], 6),
+                                                     'cpu': round(flush_timings['write'][1], 6)}
+            if timing_file:
+                try:
+                    stage_timing.write_timings_file(timing_file, file_timings)
+                    logging.info("Wrote timings of %s files to '%s'", str(len(file_timings)), timing_file)
+                except Exception as ex:
+                    logging.error("Unable to write timings file: '%s'", timing_file)
+                    logging.error("Exception: %s", str(ex))
 
         file_md = []
         if entries_written:
@@ -980,4 +780,17 @@ class RgbPlotBase(algorithm.Algorithm):
 
 if __name__ == "__main__":
     CONFIGURATION = ConfigurationRgbBase()
-    entrypoint.entrypoint(CONFIGURATION, RgbPlotBase())
+    DAEMON_PARSER = argparse.ArgumentParser(add_help=False)
+    DAEMON_PARSER.add_argument('--daemon_spool')
+    DAEMON_PARSER.add_argument('--daemon_poll', type=float, default=spool_daemon.DAEMON_POLL_SECONDS)
+    DAEMON_PARSER.add_argument('--daemon_stale', type=float, default=spool_daemon.DAEMON_STALE_SECONDS)
+    DAEMON_ARGS, DEFAULT_ARGS = DAEMON_PARSER.parse_known_args()
+    if DAEMON_ARGS.daemon_spool:
+        logging.basicConfig(level=logging.INFO)
+        DAEMON = spool_daemon.SpoolDaemon(DAEMON_ARGS.daemon_spool, DEFAULT_ARGS, CONFIGURATION, RgbPlotBase(),
+                                          DAEMON_ARGS.daemon_poll, DAEMON_ARGS.daemon_stale)
+        signal.signal(signal.SIGTERM, DAEMON.stop)
+        signal.signal(signal.SIGINT, DAEMON.stop)
+        DAEMON.run()
+    else:
+        entrypoint.entrypoint(CONFIGURATION, RgbPlotBase())